@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""Re-parse historical raw captures into the snapshots database.
+
+After a spec file has been corrected (wrong factor, missing field, ...) all
+snapshots decoded with the old spec are wrong. This tool scans a capture
+directory or archive (.zip, .tar, .tar.gz) for `*.bin` files written by
+`capture_device.py`, decodes them in parallel on all cores with a
+`ProcessPoolExecutor` and stores the results with bulk transactional inserts.
+
+Progress is checkpointed per file in the `backfill_progress` table together
+with the spec hash, so the tool is idempotent and resumable: files that were
+already decoded with the current spec are skipped, and an interrupted run
+continues where it stopped. After a spec change every file is decoded again
+and its previous snapshot is replaced.
+
+Run as:
+  python3 backfill.py captures --db data/resol_data.db
+  python3 backfill.py captures-2025.tar.gz --spec spec/DeltaSolSLL.json --workers 4
+"""
+
+import argparse
+import json
+import os
+import re
+import tarfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from datetime import datetime
+
+import config
+
+CAPTURE_NAME = re.compile(r'capture-(\d{4}-\d{2}-\d{2})T(\d{2})-(\d{2})-(\d{2})Z\.bin$')
+DEFAULT_CHUNK_SIZE = 32
+DEFAULT_BATCH_SIZE = 256
+
+
+def _archive_kind(source):
+    if os.path.isdir(source):
+        return 'dir'
+    if zipfile.is_zipfile(source):
+        return 'zip'
+    if tarfile.is_tarfile(source):
+        return 'tar'
+    raise SystemExit(f'backfill: {source} is neither a directory nor a zip/tar archive')
+
+
+def list_captures(source):
+    """Return (kind, [(name, size), ...], manifest_timestamps) for a capture source."""
+    kind = _archive_kind(source)
+    files = []
+    manifest = None
+    if kind == 'dir':
+        for root, _dirs, names in os.walk(source):
+            for name in names:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, source)
+                if name.endswith('.bin'):
+                    files.append((rel, os.path.getsize(path)))
+                elif name == 'manifest.json':
+                    with open(path, 'rb') as f:
+                        manifest = f.read()
+    elif kind == 'zip':
+        with zipfile.ZipFile(source) as zf:
+            for info in zf.infolist():
+                base = os.path.basename(info.filename)
+                if base.endswith('.bin'):
+                    files.append((info.filename, info.file_size))
+                elif base == 'manifest.json':
+                    manifest = zf.read(info)
+    else:
+        with tarfile.open(source) as tf:
+            for member in tf:
+                if not member.isfile():
+                    continue
+                base = os.path.basename(member.name)
+                if base.endswith('.bin'):
+                    files.append((member.name, member.size))
+                elif base == 'manifest.json':
+                    manifest = tf.extractfile(member).read()
+
+    timestamps = {}
+    if manifest:
+        try:
+            for sample in json.loads(manifest.decode('utf-8')).get('samples', []):
+                timestamps[sample['file']] = sample['timestamp']
+        except Exception:
+            pass
+
+    files.sort()
+    return kind, files, timestamps
+
+
+def capture_timestamp(name, timestamps):
+    """Timestamp of a capture: from the manifest, else from its file name."""
+    base = os.path.basename(name)
+    if base in timestamps:
+        return timestamps[base]
+    m = CAPTURE_NAME.search(base)
+    if m:
+        return f'{m.group(1)}T{m.group(2)}:{m.group(3)}:{m.group(4)}Z'
+    return None
+
+
+def _init_worker(spec_file):
+    import spec
+    spec.spec, spec.spec_hash = spec.load_spec(spec_file)
+
+
+def _parse_chunk(source, kind, names):
+    """Worker: read and decode a chunk of capture files. Returns [(name, parsed), ...].
+
+    For kind 'data', `names` holds (name, raw bytes) pairs read by the parent.
+    """
+    from parser import parse_raw_bytes
+
+    out = []
+    if kind == 'dir':
+        for name in names:
+            with open(os.path.join(source, name), 'rb') as f:
+                out.append((name, parse_raw_bytes(f.read())))
+    elif kind == 'zip':
+        with zipfile.ZipFile(source) as zf:
+            for name in names:
+                out.append((name, parse_raw_bytes(zf.read(name))))
+    else:
+        for name, raw in names:
+            out.append((name, parse_raw_bytes(raw)))
+    return out
+
+
+def _tasks(source, kind, todo, chunk_size):
+    """Yield (kind, chunk) work items for `_parse_chunk`.
+
+    Directories and zip files have random access, so workers open them
+    themselves. A tar archive (possibly compressed) is read once, in order,
+    by the parent; each worker gets the capture bytes of its chunk.
+    """
+    if kind != 'tar':
+        for i in range(0, len(todo), chunk_size):
+            yield kind, todo[i:i + chunk_size]
+        return
+
+    wanted = set(todo)
+    chunk = []
+    with tarfile.open(source, mode='r|*') as tf:
+        for member in tf:
+            if member.name not in wanted:
+                continue
+            chunk.append((member.name, tf.extractfile(member).read()))
+            if len(chunk) >= chunk_size:
+                yield 'data', chunk
+                chunk = []
+    if chunk:
+        yield 'data', chunk
+
+
+def run_backfill(source, db_path, spec_file=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE, force=False):
+    from db import DBManager
+    import spec
+
+    spec_file = spec_file or config.spec_file
+    _spec, spec_hash = spec.load_spec(spec_file)
+
+    kind, files, timestamps = list_captures(source)
+    db = DBManager(db_path)
+    db.connect()
+    try:
+        progress = {} if force else db.get_backfill_progress()
+        sizes = {}
+        todo = []
+        for name, size in files:
+            # capture names are unique timestamps; keying on the base name lets a
+            # directory and an archive of the same captures share one checkpoint
+            key = os.path.basename(name)
+            if progress.get(key) == (size, spec_hash):
+                continue
+            sizes[name] = (key, size)
+            todo.append(name)
+
+        print(f'Backfill: {len(files)} captures in {source}, {len(files) - len(todo)} up to date, {len(todo)} to decode')
+        if not todo:
+            return 0
+
+        pending = []
+        stored = 0
+
+        def collect(futures):
+            nonlocal pending, stored
+            for future in futures:
+                now = datetime.utcnow().isoformat() + 'Z'
+                for name, parsed in future.result():
+                    key, size = sizes[name]
+                    ts = capture_timestamp(name, timestamps)
+                    if ts is None:
+                        # checkpointed without a snapshot, like an empty parse,
+                        # so later runs do not decode it again
+                        print(f'Skipping {name}: no timestamp in manifest or file name')
+                        parsed = {}
+                    pending.append((key, size, ts, now, parsed))
+                if len(pending) >= batch_size:
+                    db.insert_backfill_batch(pending, spec_hash)
+                    stored += len(pending)
+                    print(f'Backfill: {stored}/{len(todo)} captures stored')
+                    pending = []
+
+        # bound the chunks in flight, which for tar archives hold capture bytes
+        max_in_flight = 2 * (workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(spec_file,)) as pool:
+            in_flight = set()
+            for task_kind, chunk in _tasks(source, kind, todo, chunk_size):
+                in_flight.add(pool.submit(_parse_chunk, source, task_kind, chunk))
+                if len(in_flight) >= max_in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+            collect(as_completed(in_flight))
+        if pending:
+            db.insert_backfill_batch(pending, spec_hash)
+            stored += len(pending)
+        print(f'Backfill done: {stored} captures stored')
+        return stored
+    finally:
+        db.close()
+
+
+def main():
+    p = argparse.ArgumentParser(description='Re-parse raw VBUS captures into the snapshots DB')
+    p.add_argument('source', help='capture directory or .zip/.tar(.gz) archive')
+    p.add_argument('--db', default='data/resol_data.db', help='SQLite DB path')
+    p.add_argument('--spec', default=None, help='spec file to decode with (default config.spec_file)')
+    p.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    p.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='capture files per worker task')
+    p.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='captures per DB transaction')
+    p.add_argument('--force', action='store_true', help='ignore the checkpoint and decode every capture again')
+    args = p.parse_args()
+    run_backfill(args.source, args.db, spec_file=args.spec, workers=args.workers, chunk_size=args.chunk_size,
+                 batch_size=args.batch_size, force=args.force)
+
+
+if __name__ == '__main__':
+    main()
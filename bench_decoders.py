@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Benchmark the generic field decoder against the generated decoders.
+
+For each spec, one valid message per packet is generated with vbusgen and
+decoded repeatedly by:
+- fields:  parser.decode_fields vs the codegen function (field extraction only)
+- message: parser.parse_raw_bytes with config.codegen off vs on
+
+Run as:
+  python3 bench_decoders.py
+  python3 bench_decoders.py spec/DeltaSolBXPlus.json --number 5000
+"""
+
+import argparse
+import random
+import timeit
+
+import codegen
+import config
+import parser
+import spec
+import vbusgen
+
+DEFAULT_SPECS = ['spec/DeltaSolBXPlus.json', 'spec/CitrinSLRXT.json']
+
+
+def bench_spec(spec_file, number):
+    spec.spec, spec.spec_hash = spec.load_spec(spec_file)
+    rng = random.Random(0)
+    table = codegen.build(spec.spec, spec.spec_hash)
+
+    generic_s = fast_s = 0.0
+    stream = b''
+    for packet in spec.spec['packet']:
+        key = vbusgen.packet_address(packet)
+        payload = vbusgen.random_payload(packet, rng)
+        stream += vbusgen.build_pv1_message(*key, payload)
+        if key not in table:
+            continue
+        fn = table[key][1]
+        assert fn(payload) == parser.decode_fields(packet, payload)
+        generic_s += timeit.timeit(lambda: parser.decode_fields(packet, payload), number=number)
+        fast_s += timeit.timeit(lambda: fn(payload), number=number)
+
+    results = {'fields': (generic_s, fast_s)}
+    config.codegen = False
+    codegen.uninstall()
+    expected = parser.parse_raw_bytes(stream)
+    generic_msg = timeit.timeit(lambda: parser.parse_raw_bytes(stream), number=number)
+    config.codegen = True
+    assert parser.parse_raw_bytes(stream) == expected
+    fast_msg = timeit.timeit(lambda: parser.parse_raw_bytes(stream), number=number)
+    results['message'] = (generic_msg, fast_msg)
+    codegen.uninstall()
+    return len(spec.spec['packet']), results
+
+
+def main():
+    p = argparse.ArgumentParser(description='Compare generic and generated VBus decoders')
+    p.add_argument('specs', nargs='*', default=DEFAULT_SPECS, help='spec files (default: DeltaSol BX Plus and Citrin SLR XT)')
+    p.add_argument('--number', type=int, default=2000, help='iterations per measurement')
+    args = p.parse_args()
+
+    codegen_before = getattr(config, 'codegen', False)
+    try:
+        for spec_file in args.specs:
+            packets, results = bench_spec(spec_file, args.number)
+            print(f'{spec_file} ({packets} packets, {args.number} iterations)')
+            for name, (generic, fast) in results.items():
+                print(f'  {name:8s} generic {generic / args.number * 1e6:8.1f} us  codegen {fast / args.number * 1e6:8.1f} us  '
+                      f'speedup {generic / fast:5.1f}x')
+    finally:
+        config.codegen = codegen_before
+
+
+if __name__ == '__main__':
+    main()
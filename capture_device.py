@@ -11,6 +11,10 @@ Usage:
 Files written:
   - <outdir>/capture-<iso-timestamp>.bin  (raw bytes captured)
   - <outdir>/manifest.json                (list of captures and timestamps)
+
+The manifest is written as the session goes: every capture appends its entry
+and the file is valid JSON after each append, so long sessions keep no
+per-capture state in memory and an interrupted session keeps its manifest.
 """
 
 import argparse
@@ -23,6 +27,8 @@ import config
 
 DEFAULT_DURATION = 300
 DEFAULT_INTERVAL = 30
+# upper bound for one capture, whatever the link delivers in the read window
+MAX_CAPTURE_BYTES = 1024 * 1024
 
 
 def connect_lan():
@@ -55,11 +61,11 @@ def connect_serial():
     return ser
 
 
-def read_for(sock_like, seconds=2.0):
+def read_for(sock_like, seconds=2.0, max_bytes=MAX_CAPTURE_BYTES):
     """Read available raw bytes from socket-like object for `seconds`.
 
     `sock_like` should provide `recv` (for sockets) or `read` (for serial).
-    Returns bytes.
+    Stops early once `max_bytes` were read. Returns bytes.
     """
     end = time.time() + seconds
     data = bytearray()
@@ -67,7 +73,7 @@ def read_for(sock_like, seconds=2.0):
     # Try to detect socket vs serial by attribute
     is_socket = hasattr(sock_like, 'recv')
 
-    while time.time() < end:
+    while time.time() < end and len(data) < max_bytes:
         try:
             if is_socket:
                 sock_like.settimeout(0.5)
@@ -83,12 +89,35 @@ def read_for(sock_like, seconds=2.0):
             continue
         data.extend(chunk)
 
-    return bytes(data)
+    return bytes(data[:max_bytes])
+
+
+class ManifestWriter:
+    """Append capture entries to manifest.json, keeping it valid JSON."""
+
+    _END = b'\n  ]\n}\n'
+
+    def __init__(self, path, created):
+        self.path = path
+        self.count = 0
+        self.f = open(path, 'wb')
+        self.f.write(('{\n  "created": %s,\n  "samples": [' % json.dumps(created)).encode('utf-8') + self._END)
+        self.f.flush()
+
+    def append(self, sample):
+        # overwrite the closing brackets with the entry and close again
+        self.f.seek(-len(self._END), os.SEEK_END)
+        sep = ',' if self.count else ''
+        self.f.write((sep + '\n    ' + json.dumps(sample)).encode('utf-8') + self._END)
+        self.f.flush()
+        self.count += 1
+
+    def close(self):
+        self.f.close()
 
 
 def capture_session(duration=DEFAULT_DURATION, interval=DEFAULT_INTERVAL, outdir='captures'):
     os.makedirs(outdir, exist_ok=True)
-    samples = []
 
     # Connect according to config
     if config.connection == 'lan':
@@ -98,6 +127,7 @@ def capture_session(duration=DEFAULT_DURATION, interval=DEFAULT_INTERVAL, outdir
     else:
         raise SystemExit('capture_device: config.connection must be "lan" or "serial"')
 
+    manifest = ManifestWriter(os.path.join(outdir, 'manifest.json'), datetime.utcnow().isoformat() + 'Z')
     try:
         n = max(1, int(duration // interval))
         for i in range(n):
@@ -132,24 +162,21 @@ def capture_session(duration=DEFAULT_DURATION, interval=DEFAULT_INTERVAL, outdir
             with open(json_filename, 'w', encoding='utf-8') as jf:
                 json.dump(parsed, jf, indent=2)
 
-            samples.append({'file': os.path.basename(filename), 'json': os.path.basename(json_filename), 'timestamp': ts, 'size': len(raw)})
+            manifest.append({'file': os.path.basename(filename), 'json': os.path.basename(json_filename), 'timestamp': ts, 'size': len(raw)})
 
             # wait until next interval
             if i < n - 1:
                 time.sleep(interval)
 
     finally:
+        manifest.close()
         # try to close
         try:
             sock.close()
         except Exception:
             pass
 
-    manifest = os.path.join(outdir, 'manifest.json')
-    with open(manifest, 'w', encoding='utf-8') as mf:
-        json.dump({'created': datetime.utcnow().isoformat() + 'Z', 'samples': samples}, mf, indent=2)
-
-    print(f'Done. Wrote {len(samples)} captures to "{outdir}" and manifest "{manifest}"')
+    print(f'Done. Wrote {manifest.count} captures to "{outdir}" and manifest "{manifest.path}"')
 
 
 def main():
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Generate specialised per-packet decoder functions from the spec.
+
+`parser.decode_fields` interprets the field list of a packet for every
+message. With `codegen = True` in config.py the parser instead uses one
+generated function per (destination, source, command) with straight-line
+`int.from_bytes` calls and constant factors, e.g.:
+
+    def _decode_0x0010_0x2271_0x0100(payload, _int=int.from_bytes):
+        return {
+            'Temp. Sensor 1': str(_int(payload[4:6], 'little', signed=True) * 0.1) + '°C',
+            ...
+        }
+
+The module source is built with `compile()` once per spec version; the
+compiled code is cached (marshal) in `__pycache__` next to the spec file,
+keyed by spec hash, generator version and Python version, so later starts skip code
+generation and compilation. Packets the generic decoder cannot handle
+(fields without an offset, unparsable factors) get no generated function
+and keep using the generic path, so both modes produce the same result.
+
+Run `python3 bench_decoders.py` to compare both paths.
+"""
+
+import marshal
+import os
+import sys
+from typing import Callable, Dict, Optional, Tuple
+
+import parser
+import spec as spec_module
+
+Decoder = Callable[[bytes], Dict[str, str]]
+
+# bump when the generated code changes, so stale caches are not reused
+VERSION = 1
+
+
+def _function_name(destination: int, source: int, command: int) -> str:
+    return '_decode_0x%04x_0x%04x_0x%04x' % (destination, source, command)
+
+
+def packet_source(packet: Dict) -> str:
+    """Return the source of one decoder function for `packet`.
+
+    Raises the same KeyError/ValueError as `parser.decode_fields` would for
+    fields it cannot decode.
+    """
+    destination, source, command = int(packet['destination'], 16), int(packet['source'], 16), int(packet['command'], 16)
+    lines = ['def %s(payload, _int=int.from_bytes):' % _function_name(destination, source, command), '    return {']
+    for field in packet.get('field', []):
+        offset = int(field['offset'])
+        length = (int(field['bitSize']) + 1) // 8
+        value = "_int(payload[%d:%d], 'little', signed=True)" % (offset, offset + length)
+        if 'factor' in field:
+            value = '%s * %r' % (value, float(field['factor']))
+        unit = field['unit'] if 'unit' in field else ''
+        lines.append('        %r: str(%s) + %r,' % (field['name'][0], value, unit))
+    lines.append('    }')
+    return '\n'.join(lines) + '\n'
+
+
+def module_source(spec: Dict) -> Tuple[str, Dict[Tuple[int, int, int], str]]:
+    """Return (module source, {(destination, source, command): function name})."""
+    chunks = ['# generated by codegen.py - do not edit\n']
+    names = {}
+    for packet in spec.get('packet', []):
+        try:
+            chunks.append(packet_source(packet))
+        except (KeyError, ValueError, TypeError):
+            continue
+        key = (int(packet['destination'], 16), int(packet['source'], 16), int(packet['command'], 16))
+        names[key] = _function_name(*key)
+    return '\n\n'.join(chunks), names
+
+
+def compile_packet(packet: Dict) -> Decoder:
+    """Compile a single decoder function for `packet` (used by the tests)."""
+    src = packet_source(packet)
+    namespace = {}
+    exec(compile(src, '<codegen>', 'exec'), namespace)
+    return next(v for k, v in namespace.items() if k.startswith('_decode_'))
+
+
+def cache_path(spec_hash: str, spec_file: Optional[str] = None) -> Optional[str]:
+    spec_file = spec_file or getattr(parser.config, 'spec_file', None)
+    if not spec_file or not spec_hash or not spec_hash.isalnum():
+        return None
+    directory = os.path.join(os.path.dirname(os.path.abspath(spec_file)), '__pycache__')
+    return os.path.join(directory, 'decoders-%s.v%d.%s.marshal' % (spec_hash, VERSION, sys.implementation.cache_tag))
+
+
+def build(spec: Dict, spec_hash: str, cache: Optional[str] = None) -> Dict[Tuple[int, int, int], Tuple[str, Decoder]]:
+    """Return {(destination, source, command): (device name, decoder)} for `spec`."""
+    code = names = None
+    if cache and os.path.exists(cache):
+        try:
+            with open(cache, 'rb') as f:
+                code, names = marshal.load(f)
+        except Exception:
+            code = names = None
+
+    if code is None:
+        src, names = module_source(spec)
+        code = compile(src, '<decoders %s>' % spec_hash, 'exec')
+        if cache:
+            try:
+                os.makedirs(os.path.dirname(cache), exist_ok=True)
+                tmp = cache + '.tmp'
+                with open(tmp, 'wb') as f:
+                    marshal.dump((code, names), f)
+                os.replace(tmp, cache)
+            except OSError:
+                # read-only install: just compile on every start
+                pass
+
+    namespace = {}
+    exec(code, namespace)
+    table = {}
+    for key, name in names.items():
+        table[key] = (parser.get_source_name('0x%04x' % key[1]), namespace[name])
+    return table
+
+
+def install(spec: Optional[Dict] = None, spec_hash: Optional[str] = None, cache: Optional[str] = None):
+    """Register generated decoders for the loaded spec with the parser."""
+    if spec is None:
+        spec, spec_hash = spec_module.spec, spec_module.spec_hash
+        cache = cache or cache_path(spec_hash)
+    parser.fast_decoders = build(spec, spec_hash, cache)
+    parser.fast_spec_hash = spec_hash
+
+
+def uninstall():
+    parser.fast_decoders = {}
+    parser.fast_spec_hash = None
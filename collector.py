@@ -5,18 +5,30 @@ Runs an infinite loop: every `interval` seconds it connects to the device,
 requests a short data sample, parses it using `parser.parse_raw_bytes`, and
 inserts the snapshot into the DB.
 
+With `--continuous` it instead stays connected, decodes the stream as it
+arrives and stores each field at its own rate (see scheduler.py) in batched
+writes to the `measurements` table; derived metrics are still updated every
+`interval`, from the values received since the previous update (none while
+the device is silent).
+
 Run as:
   python3 collector.py --interval 5 --db data/resol_data.db
+  python3 collector.py --continuous --db data/resol_data.db
 
 The `interval` is in minutes (default 5).
 """
 
 import time
 import argparse
+import socket
 from datetime import datetime
 
 import config
+import instrument
 from db import DBManager
+from derived import DerivedMetrics
+from memguard import MemGuard
+from scheduler import Scheduler
 
 
 def capture_once_from_socket(sock_like, read_seconds=2.0):
@@ -25,6 +37,7 @@ def capture_once_from_socket(sock_like, read_seconds=2.0):
     end = time.time() + read_seconds
     is_socket = hasattr(sock_like, 'recv')
     while time.time() < end:
+        t0 = instrument.start()
         try:
             if is_socket:
                 chunk = sock_like.recv(4096)
@@ -32,6 +45,7 @@ def capture_once_from_socket(sock_like, read_seconds=2.0):
                 chunk = sock_like.read(4096)
         except Exception:
             chunk = b''
+        instrument.stop('read', t0)
         if chunk:
             data.extend(chunk)
         else:
@@ -39,44 +53,202 @@ def capture_once_from_socket(sock_like, read_seconds=2.0):
     return bytes(data)
 
 
-def connect_device():
-    if config.connection == 'lan':
-        import socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(5.0)
-        sock.connect(config.address)
-        # try to read initial HELLO
-        try:
-            sock.recv(1024)
-        except Exception:
-            pass
-        # request stream snapshot
-        try:
-            sock.send(b'DATA\n')
-        except Exception:
-            pass
-        return sock
-    elif config.connection == 'serial':
-        import serial
-        ser = serial.Serial(config.port, baudrate=config.baudrate, timeout=1)
-        return ser
-    else:
-        raise RuntimeError('collector requires config.connection be "lan" or "serial"')
-
-
-def run_collector(db_path: str, interval_minutes: int):
-    db = DBManager(db_path)
+def read_chunk(sock_like):
+    """Read whatever is available; returns None once the connection is closed."""
+    t0 = instrument.start()
+    try:
+        if hasattr(sock_like, 'recv'):
+            chunk = sock_like.recv(4096)
+            if not chunk:
+                return None
+        else:
+            chunk = sock_like.read(4096)
+    except socket.timeout:
+        chunk = b''
+    instrument.stop('read', t0)
+    return chunk
+
+
+def connect_device(connection=None, **options):
+    """Open the configured transport (see transport.py); LAN connections are
+    logged in and streaming DATA when returned."""
+    import transport
+    return transport.open_transport(connection, **options)
+
+
+class StreamDecoder:
+    """Cut a byte stream into complete messages and extract their packets.
+
+    The pending buffer never grows beyond `max_buffer` bytes: a stream
+    without sync bytes is dropped, keeping only a possible message start.
+    """
+
+    def __init__(self, max_buffer: int = None):
+        self.buf = b''
+        self.max_buffer = max_buffer or getattr(config, 'max_buffer', 64 * 1024)
+
+    def feed(self, chunk: bytes):
+        """Add `chunk`; return the packets of all messages completed so far."""
+        return dict(self.feed_messages(chunk))
+
+    def feed_messages(self, chunk: bytes):
+        """Like `feed`, but return every completed message in stream order
+        (see `parser.extract_messages`)."""
+        from parser import MAX_MESSAGE, extract_messages
+
+        self.buf += chunk
+        # everything before the last sync byte consists of complete messages
+        cut = self.buf.rfind(b'\xAA')
+        messages = []
+        if cut > 0:
+            complete, self.buf = self.buf[:cut], self.buf[cut:]
+            messages = extract_messages(complete)
+        if len(self.buf) > self.max_buffer:
+            cut = self.buf.rfind(b'\xAA', len(self.buf) - MAX_MESSAGE)
+            self.buf = self.buf[cut:] if cut >= 0 else b''
+            instrument.count('overflow')
+        return messages
+
+
+# seconds between reconnect attempts, doubled after every failure
+RECONNECT_MIN = 1.0
+RECONNECT_MAX = 60.0
+
+
+def _backoff(delay: float, until: float = None) -> float:
+    """Sleep `delay` seconds (not past `until`) and return the next delay."""
+    if until is not None:
+        delay = min(delay, max(0.0, until - time.time()))
+    time.sleep(delay)
+    return min(max(delay, RECONNECT_MIN) * 2, RECONNECT_MAX)
+
+
+def run_continuous(db: DBManager, interval_minutes: int, derived: DerivedMetrics, latest_writer=None,
+                   connection=None, options=None, memguard=None, until: float = None):
+    """Stay connected and store fields at their scheduled rates.
+
+    Runs forever, or until the unix time `until` (soak tests).
+    """
+    from parser import decode_packets
+
+    scheduler = Scheduler.from_config(config)
+    next_derived = 0.0
+    # latest values per device/field received since the last derived update,
+    # merged over all packets (multi-packet controllers) and stamped with the
+    # receive time of the newest one; empty while the device is silent
+    fresh, fresh_ts = {}, None
+    delay = RECONNECT_MIN
+    try:
+        while until is None or time.time() < until:
+            try:
+                dev = connect_device(connection, **(options or {}))
+            except Exception as e:
+                print('Error connecting to device:', e)
+                delay = _backoff(delay, until)
+                continue
+
+            stream = StreamDecoder()
+            try:
+                while until is None or time.time() < until:
+                    try:
+                        chunk = read_chunk(dev)
+                    except OSError as e:
+                        # connection reset, broken pipe, serial.SerialException
+                        print('Error reading from device:', e)
+                        break
+                    if chunk is None:
+                        print('Device closed the connection, reconnecting')
+                        break
+                    if not chunk:
+                        time.sleep(0.1)
+                    packets = stream.feed(chunk)
+                    now = time.time()
+                    if packets:
+                        delay = RECONNECT_MIN
+                        ts = datetime.utcnow().isoformat() + 'Z'
+                        parsed = decode_packets(packets)
+                        scheduler.observe(now, ts, parsed)
+                        if latest_writer is not None:
+                            latest_writer.publish(parsed)
+                        for device, fields in parsed.items():
+                            fresh.setdefault(device, {}).update(fields)
+                        fresh_ts = ts
+
+                    if fresh and now >= next_derived:
+                        rows = derived.update(fresh_ts, fresh)
+                        if rows:
+                            db.insert_derived(fresh_ts, rows, derived.state)
+                        fresh = {}
+                        next_derived = now + interval_minutes * 60
+
+                    if scheduler.due(now):
+                        rows = scheduler.take(now)
+                        db.insert_measurements(rows)
+                        print(f'Stored {len(rows)} measurements from {scheduler.observed} decoded samples')
+                        scheduler.observed = 0
+                        instrument.write_stats(reset_after=True)
+
+                    if memguard is not None:
+                        memguard.maybe_check(now)
+            finally:
+                try:
+                    dev.close()
+                except Exception:
+                    pass
+            delay = _backoff(delay, until)
+    finally:
+        # keep what the scheduler buffered, whatever ended the loop
+        if scheduler.pending:
+            db.insert_measurements(scheduler.take(time.time()))
+
+
+def run_collector(db_path: str, interval_minutes: int, stats: bool = False,
+                  stats_log: str = 'data/instrument.log', store: str = 'json', latest_path: str = None,
+                  continuous: bool = False, connection: str = None, options: dict = None):
+    db = DBManager(db_path, compact=(store == 'compact'))
     db.connect()
 
-    from parser import parse_raw_bytes
+    # SIGUSR1 toggles instrumentation at runtime, SIGUSR2 starts/stops a
+    # profile capture; stats are written to `stats_log`, never to stdout
+    instrument.enable(stats)
+    instrument.setup_log(stats_log)
+    instrument.install_signal_handlers()
+
+    from parser import decode_packets, extract_packets, parse_raw_bytes
+
+    # derived metrics continue from the state stored with the last sample
+    derived = DerivedMetrics.from_config(config)
+    state = db.load_derived_state()
+    if state:
+        derived.state = state
+
+    # latest values for local readers (see latest.py)
+    latest_writer = None
+    if latest_path:
+        import spec
+        from latest import LatestWriter, layout_from_spec
+        latest_writer = LatestWriter(latest_path, layout_from_spec(spec.spec))
+
+    # RSS/heap self-checks, reported as gauges in the stats log (see memguard.py)
+    memguard = MemGuard.from_config(config)
+
+    if continuous:
+        print(f'Starting continuous collector: derived interval={interval_minutes}min db={db_path}')
+        try:
+            run_continuous(db, interval_minutes, derived, latest_writer, connection, options, memguard)
+        except KeyboardInterrupt:
+            print('Collector stopping (KeyboardInterrupt)')
+        finally:
+            db.close()
+        return
 
-    print(f'Starting collector: interval={interval_minutes}min db={db_path}')
+    print(f'Starting collector: interval={interval_minutes}min db={db_path} store={store}')
     try:
         while True:
             ts = datetime.utcnow().isoformat() + 'Z'
             print(f'[{ts}] Capturing snapshot...')
             try:
-                dev = connect_device()
+                dev = connect_device(connection, **(options or {}))
                 raw = capture_once_from_socket(dev, read_seconds=2.0)
                 try:
                     dev.close()
@@ -86,18 +258,43 @@ def run_collector(db_path: str, interval_minutes: int):
                 print('Error connecting to device:', e)
                 raw = b''
 
-            parsed = {}
-            if raw:
-                try:
-                    parsed = parse_raw_bytes(raw)
-                except Exception as e:
-                    print('Error parsing raw capture:', e)
+            if store == 'raw':
+                # keep only validated payloads; decoding happens at query time
+                packets = extract_packets(raw) if raw else {}
+                if packets:
+                    db.insert_raw_snapshot(ts, packets)
+                    print(f'Inserted {len(packets)} raw packets')
+                else:
+                    print('No valid packets in snapshot')
+                # only derived metrics and --latest need values; without them
+                # nothing is decoded or formatted on the ingest path
+                parsed = {}
+                if packets and (derived.enabled or latest_writer is not None):
+                    parsed = decode_packets(packets)
+            else:
+                parsed = {}
+                if raw:
+                    try:
+                        parsed = parse_raw_bytes(raw)
+                    except Exception as e:
+                        print('Error parsing raw capture:', e)
+
+                if parsed:
+                    db.insert_snapshot(ts, parsed)
+                    print(f'Inserted {sum(len(v) for v in parsed.values())} measurements')
+                else:
+                    print('No parsed fields from snapshot')
+
+            if parsed and latest_writer is not None:
+                latest_writer.publish(parsed)
 
             if parsed:
-                db.insert_snapshot(ts, parsed)
-                print(f'Inserted {sum(len(v) for v in parsed.values())} measurements')
-            else:
-                print('No parsed fields from snapshot')
+                rows = derived.update(ts, parsed)
+                if rows:
+                    db.insert_derived(ts, rows, derived.state)
+
+            memguard.maybe_check()
+            instrument.write_stats(reset_after=True)
 
             # Sleep until next interval
             time.sleep(interval_minutes * 60)
@@ -112,8 +309,33 @@ def main():
     p = argparse.ArgumentParser()
     p.add_argument('--db', default='data/resol_data.db', help='SQLite DB path')
     p.add_argument('--interval', type=int, default=5, help='Interval in minutes between snapshots (default 5)')
+    p.add_argument('--store', choices=('json', 'compact', 'raw'), default='json',
+                   help='snapshot encoding: json rows, compact packed values or raw packet payloads decoded at query time '
+                        '(default json); raw still decodes on ingest when derived metrics (config.derived_*) or --latest are used')
+    p.add_argument('--continuous', action='store_true',
+                   help='stay connected and store each field at its scheduled rate (config.schedule_rules)')
+    p.add_argument('--latest', nargs='?', const='', default=None, metavar='PATH',
+                   help='publish the latest values to a memory-mapped file for local readers (default path /dev/shm/resol-latest)')
+    p.add_argument('--stats', action='store_true', default=getattr(config, 'instrument', False),
+                   help='enable hot-path instrumentation from the start (toggle at runtime with SIGUSR1)')
+    p.add_argument('--stats-log', default=getattr(config, 'instrument_log', 'data/instrument.log'),
+                   help='rotating log for instrumentation stats and profile captures')
+    p.add_argument('--connection', default=None,
+                   help='transport to read from: lan, serial or replay (default config.connection, see transport.py)')
+    p.add_argument('--address', default=None, metavar='HOST:PORT',
+                   help='LAN adapter address, e.g. a simulator.py adapter (default config.address)')
     args = p.parse_args()
-    run_collector(args.db, args.interval)
+    connection, options = args.connection, None
+    if args.address:
+        import transport
+        connection = connection or 'lan'
+        options = {'address': transport.parse_address(args.address)}
+    latest_path = args.latest
+    if latest_path == '':
+        from latest import default_path
+        latest_path = default_path()
+    run_collector(args.db, args.interval, stats=args.stats, stats_log=args.stats_log, store=args.store,
+                  latest_path=latest_path, continuous=args.continuous, connection=connection, options=options)
 
 
 if __name__ == '__main__':
@@ -20,3 +20,53 @@ spec_file = 'spec/DeltaSolSLL.json'
 expected_packets = 1
 
 debug = False 
+
+# timers/counters for read, sync, septet decoding, spec matching, field
+# extraction and DB commits (see instrument.py); written to instrument_log
+instrument = False
+instrument_log = 'data/instrument.log'
+
+# derived metrics computed incrementally by collector.py (see derived.py);
+# names are field names of the spec. Leave all empty to skip decoding on
+# ingest with `collector.py --store raw`
+derived_counters = ['Heat quantity', 'Operating Hours Relay 1', 'Operating Hours Relay 2', 'Operating Hours Relay 3']
+# optional counter ranges for wrap detection, e.g. {'Heat quantity': 2 ** 32}
+derived_counter_modulus = {}
+derived_on_time = ['Pump Speed Relay 1', 'Pump Speed Relay 2', 'Pump Speed Relay 3']
+derived_integrals = ['Flow rate V40']
+derived_differences = {'Collector delta-T': ('Temp. Sensor 1', 'Temp. Sensor 2')}
+# seconds; longer gaps between samples are not integrated
+derived_max_gap = 900
+
+# decode packets with functions generated from the spec (see codegen.py)
+codegen = False
+
+# per-field storage rates for collector.py --continuous (see scheduler.py):
+# fnmatch pattern on "field" or "device/field" -> policy; first match wins.
+# min/max are seconds between stored values, deadband the change that
+# triggers a store before max (derived from observed noise if missing)
+schedule_rules = {
+    'Pump Speed Relay *': {'min': 10, 'max': 300, 'deadband': 0},
+    'Temp. Sensor *': {'min': 10, 'max': 300},
+    'Flow rate *': {'min': 10, 'max': 300},
+    'SW-Version': {'min': 3600, 'max': 86400, 'deadband': 0},
+    'System Date': {'min': 3600, 'max': 86400},
+    'Operating Hours Relay *': {'min': 300, 'max': 3600, 'deadband': 0},
+}
+schedule_default = {'min': 60, 'max': 900}
+# seconds between batched writes
+schedule_flush = 60
+
+# per-connection options passed to the transport factories (see transport.py),
+# e.g. {'replay': {'pattern': 'captures/*.bin', 'bytes_per_second': 960}}
+transport_options = {}
+
+# memory bounds for 24/7 operation (see memguard.py):
+# receive buffer bytes without complete messages before dropping and resyncing
+max_buffer = 64 * 1024
+# seconds between RSS/heap self-checks of collector.py, 0 disables
+memory_check_interval = 300
+# log a warning and count 'memory_limit' above this RSS (MB), 0 disables
+memory_limit_mb = 0
+# also trace Python allocations and log the top growing sites (costs CPU)
+memory_trace = False
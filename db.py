@@ -3,23 +3,74 @@
 
 Schema:
 - measurements(id INTEGER PRIMARY KEY, ts TEXT, device TEXT, field TEXT, value REAL, unit TEXT)
+- snapshots(id INTEGER PRIMARY KEY, ts TEXT, data TEXT)  -- JSON snapshot
+- snapshots_compact(id INTEGER PRIMARY KEY, ts TEXT, schema_id INTEGER, data BLOB)
+- snapshot_schemas(id INTEGER PRIMARY KEY, hash TEXT UNIQUE, layout TEXT)
+- raw_snapshots(id INTEGER PRIMARY KEY, ts TEXT, data BLOB)  -- validated packet payloads
+- derived(id INTEGER PRIMARY KEY, ts TEXT, name TEXT, value REAL)  -- see derived.py
+- derived_state(id INTEGER PRIMARY KEY, state TEXT)  -- incremental state of derived.py
+
+With `compact=True` snapshots are stored packed (see snapshot_codec.py): the
+device/field/unit layout once in `snapshot_schemas`, each row only the values.
+
+`insert_raw_snapshot` keeps the raw packet payloads instead (see
+parser.extract_packets); they are decoded lazily when read, with the spec that
+is current at read time, so spec corrections apply to old rows as well.
 
 Provides a small API for inserting snapshots atomically.
 """
 
+import re
 import sqlite3
-from typing import Dict
+import instrument
+import snapshot_codec
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+def parse_value_and_unit(raw: str) -> Tuple[Optional[float], Optional[str]]:
+    """Try to extract a numeric value and unit from a string like '23.4°C' or '0 %'.
+    Returns (float or None, unit or None).
+    """
+    if raw is None:
+        return None, None
+    if isinstance(raw, (int, float)):
+        return float(raw), None
+    s = str(raw).strip()
+    # split off trailing non-numeric characters
+    # handle formats like '23.4 °C', '888.8 °C', '0 %', '38.0 h'
+    m = re.match(r'^([-+]?[0-9]*\.?[0-9]+)\s*(.*)$', s)
+    if m:
+        try:
+            val = float(m.group(1))
+        except Exception:
+            val = None
+        unit = m.group(2).strip() if m.group(2).strip() != '' else None
+        return val, unit
+    return None, s
 
 
 class DBManager:
-    def __init__(self, path: str = 'data/resol_data.db'):
+    def __init__(self, path: str = 'data/resol_data.db', compact: bool = False):
         self.path = path
+        self.compact = compact
         self.conn = None
+        # layout hash -> snapshot_schemas.id, and id -> layout JSON
+        self._schema_ids = {}
+        self._schema_layouts = {}
+
+    def connect(self, readonly: bool = False):
+        """Open the DB; `readonly=True` opens an existing DB without touching its schema
+        (for exporters and other readers running next to the collector)."""
+        if readonly:
+            import pathlib
+            uri = pathlib.Path(self.path).absolute().as_uri() + '?mode=ro'
+            self.conn = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=False)
+            return
 
-    def connect(self):
         # Ensure directory exists
         import os
-        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
         self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
         self.conn.execute('PRAGMA journal_mode=WAL')
         self._create_tables()
@@ -53,6 +104,74 @@ class DBManager:
             '''
         )
         cur.execute('CREATE INDEX IF NOT EXISTS idx_snapshots_ts ON snapshots(ts)')
+
+        # compact snapshots: values only, layout stored once per schema
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS snapshot_schemas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hash TEXT NOT NULL UNIQUE,
+                layout TEXT NOT NULL -- JSON list of [device, field, unit, kind]
+            )
+            '''
+        )
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS snapshots_compact (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts TEXT NOT NULL,
+                schema_id INTEGER NOT NULL REFERENCES snapshot_schemas(id),
+                data BLOB NOT NULL
+            )
+            '''
+        )
+        cur.execute('CREATE INDEX IF NOT EXISTS idx_snapshots_compact_ts ON snapshots_compact(ts)')
+
+        # raw snapshots: deduplicated, checksum-validated packet payloads
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS raw_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts TEXT NOT NULL,
+                data BLOB NOT NULL -- parser.pack_packets() of {(dst, src, cmd): payload}
+            )
+            '''
+        )
+        cur.execute('CREATE INDEX IF NOT EXISTS idx_raw_snapshots_ts ON raw_snapshots(ts)')
+
+        # derived series written incrementally by the collector (derived.py)
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS derived (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts TEXT NOT NULL,
+                name TEXT NOT NULL,
+                value REAL
+            )
+            '''
+        )
+        cur.execute('CREATE INDEX IF NOT EXISTS idx_derived_name_ts ON derived(name, ts)')
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS derived_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                state TEXT NOT NULL -- JSON of DerivedMetrics.state
+            )
+            '''
+        )
+
+        # checkpoint of capture files already re-parsed by backfill.py
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS backfill_progress (
+                file TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                spec_hash TEXT NOT NULL,
+                snapshot_id INTEGER, -- row in `snapshots`, NULL if nothing parsed
+                done_at TEXT NOT NULL
+            )
+            '''
+        )
         self.conn.commit()
 
     def insert_snapshot(self, ts: str, snapshot: Dict[str, Dict[str, str]]):
@@ -61,15 +180,196 @@ class DBManager:
         This is the preferred storage method: the entire parsed snapshot is saved
         as JSON in one row (timestamp + data). The legacy `measurements` table is
         kept for backwards compatibility but not written by default.
+
+        With `compact=True` the snapshot goes to `snapshots_compact` instead,
+        unless it cannot be packed losslessly, in which case it is stored as JSON.
         """
         if self.conn is None:
             self.connect()
 
+        if self.compact:
+            encoded = snapshot_codec.encode(snapshot)
+            if encoded is not None:
+                layout, blob = encoded
+                schema_id = self._schema_id(layout)
+                t0 = instrument.start()
+                self.conn.execute('INSERT INTO snapshots_compact (ts, schema_id, data) VALUES (?, ?, ?)', (ts, schema_id, blob))
+                self.conn.commit()
+                instrument.stop('db_commit', t0)
+                return
+
         cur = self.conn.cursor()
         import json as _json
         json_text = _json.dumps(snapshot, ensure_ascii=False)
+        t0 = instrument.start()
         cur.execute('INSERT INTO snapshots (ts, data) VALUES (?, ?)', (ts, json_text))
         self.conn.commit()
+        instrument.stop('db_commit', t0)
+
+    def insert_raw_snapshot(self, ts: str, packets: Dict[Tuple[int, int, int], bytes]):
+        """Insert the raw packet payloads of one capture into `raw_snapshots`."""
+        if self.conn is None:
+            self.connect()
+
+        from parser import pack_packets
+        blob = pack_packets(packets)
+        t0 = instrument.start()
+        self.conn.execute('INSERT INTO raw_snapshots (ts, data) VALUES (?, ?)', (ts, blob))
+        self.conn.commit()
+        instrument.stop('db_commit', t0)
+
+    def insert_derived(self, ts: str, rows: List[Tuple[str, float]], state: Dict):
+        """Insert derived values and the engine state that produced them atomically."""
+        if self.conn is None:
+            self.connect()
+
+        import json as _json
+        t0 = instrument.start()
+        with self.conn:
+            self.conn.executemany('INSERT INTO derived (ts, name, value) VALUES (?,?,?)', [(ts, name, value) for name, value in rows])
+            self.conn.execute('INSERT OR REPLACE INTO derived_state (id, state) VALUES (1, ?)', (_json.dumps(state),))
+        instrument.stop('db_commit', t0)
+
+    def load_derived_state(self) -> Optional[Dict]:
+        if self.conn is None:
+            self.connect()
+
+        import json as _json
+        row = self.conn.execute('SELECT state FROM derived_state WHERE id = 1').fetchone()
+        return _json.loads(row[0]) if row else None
+
+    def _schema_id(self, layout: List[List[str]]) -> int:
+        """Return the `snapshot_schemas` id of a layout, inserting it if new."""
+        h = snapshot_codec.layout_hash(layout)
+        schema_id = self._schema_ids.get(h)
+        if schema_id is not None:
+            return schema_id
+
+        import json as _json
+        cur = self.conn.cursor()
+        cur.execute('SELECT id FROM snapshot_schemas WHERE hash = ?', (h,))
+        row = cur.fetchone()
+        if row is None:
+            cur.execute('INSERT INTO snapshot_schemas (hash, layout) VALUES (?, ?)', (h, _json.dumps(layout, ensure_ascii=False)))
+            schema_id = cur.lastrowid
+        else:
+            schema_id = row[0]
+        self._schema_ids[h] = schema_id
+        return schema_id
+
+    def _schema_layout(self, schema_id: int) -> str:
+        layout = self._schema_layouts.get(schema_id)
+        if layout is None:
+            cur = self.conn.cursor()
+            cur.execute('SELECT layout FROM snapshot_schemas WHERE id = ?', (schema_id,))
+            layout = self._schema_layouts[schema_id] = cur.fetchone()[0]
+        return layout
+
+    SNAPSHOT_TABLES = ('snapshots', 'snapshots_compact', 'raw_snapshots')
+
+    def snapshot_chunk(self, table: str, after_id: int, limit: int,
+                       day: Optional[str] = None) -> List[Tuple[int, str, Dict[str, Dict[str, str]]]]:
+        """Return up to `limit` decoded (id, ts, snapshot) rows of `table` with id > after_id,
+        optionally only those of one UTC `day` (YYYY-MM-DD)."""
+        if self.conn is None:
+            self.connect()
+
+        import json as _json
+        if table not in self.SNAPSHOT_TABLES:
+            raise ValueError('not a snapshot table: %s' % table)
+        clause = 'id > ?' + (' AND ts >= ? AND ts < ?' if day else '')
+        # ISO timestamps of the day sort between 'YYYY-MM-DD' and 'YYYY-MM-DD~'
+        args = (after_id, day, day + '~', limit) if day else (after_id, limit)
+        if table == 'snapshots':
+            rows = self.conn.execute('SELECT id, ts, data FROM snapshots WHERE ' + clause + ' ORDER BY id LIMIT ?', args)
+            return [(row_id, ts, _json.loads(data)) for row_id, ts, data in rows.fetchall()]
+        if table == 'snapshots_compact':
+            rows = self.conn.execute('SELECT id, ts, schema_id, data FROM snapshots_compact WHERE ' + clause + ' ORDER BY id LIMIT ?', args)
+            return [(row_id, ts, snapshot_codec.decode(self._schema_layout(schema_id), data))
+                    for row_id, ts, schema_id, data in rows.fetchall()]
+        from parser import decode_packets, unpack_packets
+        rows = self.conn.execute('SELECT id, ts, data FROM raw_snapshots WHERE ' + clause + ' ORDER BY id LIMIT ?', args)
+        return [(row_id, ts, decode_packets(unpack_packets(data))) for row_id, ts, data in rows.fetchall()]
+
+    def iter_snapshots(self, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Dict[str, str]]]]:
+        """Yield (ts, snapshot) from the JSON, compact and raw tables in timestamp order.
+
+        Raw snapshots are decoded on the fly with the currently loaded spec.
+
+        `start` is inclusive and `end` exclusive; both are ISO timestamps.
+        """
+        if self.conn is None:
+            self.connect()
+
+        import heapq
+        import json as _json
+        where = []
+        args = []
+        if start is not None:
+            where.append('ts >= ?')
+            args.append(start)
+        if end is not None:
+            where.append('ts < ?')
+            args.append(end)
+        clause = (' WHERE ' + ' AND '.join(where)) if where else ''
+
+        json_rows = (
+            (ts, _json.loads(data))
+            for ts, data in self.conn.execute('SELECT ts, data FROM snapshots' + clause + ' ORDER BY ts, id', args)
+        )
+        compact_rows = (
+            (ts, snapshot_codec.decode(self._schema_layout(schema_id), data))
+            for ts, schema_id, data in self.conn.cursor().execute(
+                'SELECT ts, schema_id, data FROM snapshots_compact' + clause + ' ORDER BY ts, id', args)
+        )
+        from parser import decode_packets, unpack_packets
+        raw_rows = (
+            (ts, decode_packets(unpack_packets(data)))
+            for ts, data in self.conn.cursor().execute('SELECT ts, data FROM raw_snapshots' + clause + ' ORDER BY ts, id', args)
+        )
+        return heapq.merge(json_rows, compact_rows, raw_rows, key=lambda row: row[0])
+
+    def get_backfill_progress(self) -> Dict[str, Tuple[int, str]]:
+        """Return {file: (size, spec_hash)} for all capture files already backfilled."""
+        if self.conn is None:
+            self.connect()
+
+        cur = self.conn.cursor()
+        cur.execute('SELECT file, size, spec_hash FROM backfill_progress')
+        return {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+
+    def insert_backfill_batch(self, items: List[Tuple[str, int, str, str, Dict[str, Dict[str, str]]]], spec_hash: str):
+        """Store re-parsed captures and their checkpoint in a single transaction.
+
+        `items` is a list of (file, size, ts, done_at, snapshot). A snapshot
+        written by an earlier backfill of the same file is replaced, so running
+        the backfill again never duplicates rows.
+        """
+        if self.conn is None:
+            self.connect()
+
+        import json as _json
+        t0 = instrument.start()
+        with self.conn:
+            cur = self.conn.cursor()
+            files = [(item[0],) for item in items]
+            cur.executemany(
+                'DELETE FROM snapshots WHERE id = (SELECT snapshot_id FROM backfill_progress WHERE file = ?)',
+                files,
+            )
+            for file, size, ts, done_at, snapshot in items:
+                snapshot_id = None
+                if snapshot:
+                    cur.execute(
+                        'INSERT INTO snapshots (ts, data) VALUES (?, ?)',
+                        (ts, _json.dumps(snapshot, ensure_ascii=False)),
+                    )
+                    snapshot_id = cur.lastrowid
+                cur.execute(
+                    'INSERT OR REPLACE INTO backfill_progress (file, size, spec_hash, snapshot_id, done_at) VALUES (?,?,?,?,?)',
+                    (file, size, spec_hash, snapshot_id, done_at),
+                )
+        instrument.stop('db_commit', t0)
 
     def insert_snapshot_rows(self, ts: str, snapshot: Dict[str, Dict[str, str]]):
         """(Compatibility helper) Insert snapshot as normalized rows into `measurements`.
@@ -84,35 +384,29 @@ class DBManager:
         for device, fields in snapshot.items():
             for field_name, raw_value in fields.items():
                 # try to split numeric value and unit
-                value, unit = self._parse_value_and_unit(raw_value)
+                value, unit = parse_value_and_unit(raw_value)
                 rows.append((ts, device, field_name, value, unit))
 
         if rows:
+            t0 = instrument.start()
             cur.executemany('INSERT INTO measurements (ts, device, field, value, unit) VALUES (?,?,?,?,?)', rows)
             self.conn.commit()
+            instrument.stop('db_commit', t0)
 
-    @staticmethod
-    def _parse_value_and_unit(raw: str):
-        """Try to extract a numeric value and unit from a string like '23.4°C' or '0 %'.
-        Returns (float or None, unit or None).
-        """
-        if raw is None:
-            return None, None
-        if isinstance(raw, (int, float)):
-            return float(raw), None
-        s = str(raw).strip()
-        # split off trailing non-numeric characters
-        # handle formats like '23.4 °C', '888.8 °C', '0 %', '38.0 h'
-        import re
-        m = re.match(r'^([-+]?[0-9]*\.?[0-9]+)\s*(.*)$', s)
-        if m:
-            try:
-                val = float(m.group(1))
-            except Exception:
-                val = None
-            unit = m.group(2).strip() if m.group(2).strip() != '' else None
-            return val, unit
-        return None, s
+    def insert_measurements(self, rows: List[Tuple[str, str, str, Optional[float], Optional[str]]]):
+        """Insert pre-parsed (ts, device, field, value, unit) rows in one transaction."""
+        if not rows:
+            return
+        if self.conn is None:
+            self.connect()
+
+        t0 = instrument.start()
+        with self.conn:
+            self.conn.executemany('INSERT INTO measurements (ts, device, field, value, unit) VALUES (?,?,?,?,?)', rows)
+        instrument.stop('db_commit', t0)
+
+    # kept for callers of the former private static method
+    _parse_value_and_unit = staticmethod(parse_value_and_unit)
 
     def close(self):
         if self.conn:
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Incremental derived metrics computed by the collector as snapshots arrive.
+
+Instead of scanning the whole snapshots table to compute daily yield, pump
+duty cycle or collector-to-tank delta-T, `DerivedMetrics.update()` keeps a
+small amount of state between samples and returns the derived values for
+each new snapshot, which the collector writes to the `derived` table.
+
+Metric kinds (field names as they appear in the snapshot, configured in
+config.py):
+
+- counters (e.g. "Heat quantity", "Operating Hours Relay 1"):
+  `<field>.delta` increase since the previous sample and `<field>.today`
+  sum of increases since UTC midnight. A decrease is treated as a wrap when
+  a modulus is configured for the counter, otherwise as a counter reset (the
+  new value is the increase since the reset).
+- on_time (e.g. "Pump Speed Relay 1"): seconds the value was > 0 today
+  (`<field>.on_s`) and the duty cycle over the observed time today
+  (`<field>.duty`).
+- integrals (e.g. "Flow rate V40" in l/h): trapezoidal integral of the value
+  over hours since UTC midnight (`<field>.integral`, e.g. litres).
+- differences: `name -> (field_a, field_b)`, emitted as `field_a - field_b`
+  (e.g. collector-to-tank delta-T).
+
+Intervals longer than `max_gap` seconds (collector or device down) are not
+integrated, so an outage does not count as pump on-time or flow.
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from db import parse_value_and_unit
+
+
+def _parse_ts(ts: str) -> datetime:
+    return datetime.fromisoformat(ts[:-1] if ts.endswith('Z') else ts)
+
+
+def flatten(snapshot: Dict[str, Dict[str, str]]) -> Dict[str, float]:
+    """Map field name -> numeric value; the first device reporting a field wins."""
+    values = {}
+    for fields in snapshot.values():
+        for name, raw in fields.items():
+            if name in values:
+                continue
+            value, _unit = parse_value_and_unit(raw)
+            if value is not None:
+                values[name] = value
+    return values
+
+
+class DerivedMetrics:
+    def __init__(self, counters: Sequence[str] = (), on_time: Sequence[str] = (), integrals: Sequence[str] = (),
+                 differences: Optional[Dict[str, Tuple[str, str]]] = None,
+                 counter_modulus: Optional[Dict[str, float]] = None, max_gap: float = 900.0):
+        self.counters = list(counters)
+        self.on_time = list(on_time)
+        self.integrals = list(integrals)
+        self.differences = dict(differences or {})
+        self.counter_modulus = dict(counter_modulus or {})
+        self.max_gap = max_gap
+        # last sample: ts, day and raw values; per-series accumulators for the
+        # current day. JSON-serialisable so it can be persisted across restarts.
+        self.state = {'ts': None, 'day': None, 'last': {}, 'today': {}, 'observed_s': 0.0}
+
+    @classmethod
+    def from_config(cls, config) -> 'DerivedMetrics':
+        return cls(
+            counters=getattr(config, 'derived_counters', ()),
+            on_time=getattr(config, 'derived_on_time', ()),
+            integrals=getattr(config, 'derived_integrals', ()),
+            differences=getattr(config, 'derived_differences', {}),
+            counter_modulus=getattr(config, 'derived_counter_modulus', {}),
+            max_gap=getattr(config, 'derived_max_gap', 900.0),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """False when no metric is configured, so callers can skip decoding."""
+        return bool(self.counters or self.on_time or self.integrals or self.differences)
+
+    def _counter_delta(self, name: str, prev: float, cur: float) -> float:
+        if cur >= prev:
+            return cur - prev
+        modulus = self.counter_modulus.get(name)
+        if modulus:
+            # wrapped around the counter range
+            return cur + modulus - prev
+        # counter was reset (device restart, manual reset)
+        return max(cur, 0.0)
+
+    def update(self, ts: str, snapshot: Dict[str, Dict[str, str]]) -> List[Tuple[str, float]]:
+        """Feed one snapshot and return [(series name, value), ...] for `ts`."""
+        values = flatten(snapshot)
+        state = self.state
+        now = _parse_ts(ts)
+        day = now.date().isoformat()
+        if state['day'] != day:
+            state['day'] = day
+            state['today'] = {}
+            state['observed_s'] = 0.0
+
+        dt = None
+        if state['ts'] is not None:
+            dt = (now - _parse_ts(state['ts'])).total_seconds()
+            if dt <= 0 or dt > self.max_gap:
+                dt = None
+        if dt is not None:
+            state['observed_s'] += dt
+
+        last = state['last']
+        today = state['today']
+        out = []
+
+        for name in self.counters:
+            if name not in values:
+                continue
+            if name in last:
+                delta = self._counter_delta(name, last[name], values[name])
+                today[name + '.today'] = today.get(name + '.today', 0.0) + delta
+                out.append((name + '.delta', delta))
+            out.append((name + '.today', today.get(name + '.today', 0.0)))
+
+        for name in self.on_time:
+            if name not in values:
+                continue
+            if dt is not None and last.get(name, 0.0) > 0:
+                # previous state held until this sample
+                today[name + '.on_s'] = today.get(name + '.on_s', 0.0) + dt
+            on_s = today.get(name + '.on_s', 0.0)
+            out.append((name + '.on_s', on_s))
+            if state['observed_s'] > 0:
+                out.append((name + '.duty', on_s / state['observed_s']))
+
+        for name in self.integrals:
+            if name not in values:
+                continue
+            if dt is not None and name in last:
+                today[name + '.integral'] = today.get(name + '.integral', 0.0) + (last[name] + values[name]) / 2.0 * dt / 3600.0
+            out.append((name + '.integral', today.get(name + '.integral', 0.0)))
+
+        for name, (a, b) in self.differences.items():
+            if a in values and b in values:
+                out.append((name, values[a] - values[b]))
+
+        for name in self.counters + self.on_time + self.integrals:
+            if name in values:
+                last[name] = values[name]
+        state['ts'] = ts
+        return out
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""Export the SQLite data to columnar Parquet or Arrow IPC files for analytics.
+
+Reads the collector DB read-only, in chunks ordered by row id, and appends
+day partitions (hive style, `date=YYYY-MM-DD`) below the output directory:
+
+- snapshots/: one row per snapshot from the `snapshots`, `snapshots_compact`
+  and `raw_snapshots` tables, with a `ts` timestamp column and one float64
+  column per "device/field" (unit kept in the column metadata)
+- measurements/ and derived/: the long tables (ts, device, field, value,
+  unit) and (ts, name, value) as written by `collector.py --continuous` and
+  the derived-metric engine
+
+Exports are incremental: the last exported row id per table is kept in
+`<outdir>/_export_state.json`, and each run only appends rows added since.
+Snapshots replaced by `backfill.py` (deleted and inserted again with a new
+id) would otherwise appear twice, so the state also keeps the number of
+snapshot rows exported per day; a day with fewer rows left in the DB is
+written again from scratch (its files, compacted or not, are replaced).
+Every chunk becomes one new file per day; `--compact` afterwards merges the
+files of each day into a single time-sorted file. Columns can differ between
+files when devices or spec fields change, so read the dataset with schema
+unification (e.g. `pyarrow.dataset` with `unify_schemas`, or DuckDB
+`union_by_name`).
+
+Requires pyarrow (`pip install pyarrow`), which is only imported here.
+
+Run as:
+  python3 export.py --db data/resol_data.db --out export
+  python3 export.py --db data/resol_data.db --out export --format arrow --compact
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+from db import DBManager, parse_value_and_unit
+
+DEFAULT_CHUNK = 5000
+STATE_FILE = '_export_state.json'
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        sys.exit('export.py requires pyarrow: python3 -m pip install pyarrow')
+
+
+def _parse_ts(ts):
+    dt = datetime.fromisoformat(ts[:-1] if ts.endswith('Z') else ts)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def load_state(outdir):
+    path = os.path.join(outdir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(outdir, state):
+    path = os.path.join(outdir, STATE_FILE)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def snapshot_table(rows):
+    """Build a wide table from [(id, ts, snapshot), ...] sorted by ts."""
+    import pyarrow as pa
+
+    columns = {}
+    units = {}
+    for _row_id, _ts, snapshot in rows:
+        for device, fields in snapshot.items():
+            for name, raw in fields.items():
+                key = device + '/' + name
+                if key not in columns:
+                    columns[key] = []
+                    units[key] = parse_value_and_unit(raw)[1] or ''
+
+    n = len(rows)
+    for values in columns.values():
+        values.extend([None] * n)
+    for i, (_row_id, _ts, snapshot) in enumerate(rows):
+        for device, fields in snapshot.items():
+            for name, raw in fields.items():
+                columns[device + '/' + name][i] = parse_value_and_unit(raw)[0]
+
+    arrays = [pa.array([_parse_ts(ts) for _id, ts, _s in rows], type=pa.timestamp('ms', tz='UTC'))]
+    fields = [pa.field('ts', pa.timestamp('ms', tz='UTC'))]
+    for key in sorted(columns):
+        arrays.append(pa.array(columns[key], type=pa.float64()))
+        fields.append(pa.field(key, pa.float64(), metadata={'unit': units[key]}))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def long_table(kind, rows):
+    import pyarrow as pa
+
+    ts = pa.array([_parse_ts(row[1]) for row in rows], type=pa.timestamp('ms', tz='UTC'))
+    if kind == 'measurements':
+        return pa.table({
+            'ts': ts,
+            'device': pa.array([row[2] for row in rows], type=pa.string()),
+            'field': pa.array([row[3] for row in rows], type=pa.string()),
+            'value': pa.array([row[4] for row in rows], type=pa.float64()),
+            'unit': pa.array([row[5] for row in rows], type=pa.string()),
+        })
+    return pa.table({
+        'ts': ts,
+        'name': pa.array([row[2] for row in rows], type=pa.string()),
+        'value': pa.array([row[3] for row in rows], type=pa.float64()),
+    })
+
+
+def write_table(table, path, fmt):
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    if fmt == 'parquet':
+        pq.write_table(table, tmp, compression='zstd')
+    else:
+        feather.write_feather(table, tmp, compression='zstd')
+    os.replace(tmp, path)
+
+
+def read_table(path, fmt):
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    return pq.read_table(path) if fmt == 'parquet' else feather.read_table(path)
+
+
+def _by_day(rows):
+    days = {}
+    for row in sorted(rows, key=lambda row: row[1]):
+        days.setdefault(row[1][:10], []).append(row)
+    return days
+
+
+def _existing_tables(db):
+    return {row[0] for row in db.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def _chunks(db, table, after_id, chunk, day=None):
+    """Yield lists of rows with id > after_id; rows start with (id, ts, ...)."""
+    while True:
+        if table in DBManager.SNAPSHOT_TABLES:
+            rows = db.snapshot_chunk(table, after_id, chunk, day=day)
+        elif table == 'measurements':
+            rows = db.conn.execute('SELECT id, ts, device, field, value, unit FROM measurements WHERE id > ? ORDER BY id LIMIT ?',
+                                   (after_id, chunk)).fetchall()
+        else:
+            rows = db.conn.execute('SELECT id, ts, name, value FROM derived WHERE id > ? ORDER BY id LIMIT ?',
+                                   (after_id, chunk)).fetchall()
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+
+
+def _snapshot_days(db, tables, state):
+    """{day: rows} of the snapshot tables up to their export checkpoints."""
+    days = {}
+    for table in tables:
+        for day, n in db.conn.execute('SELECT substr(ts, 1, 10), COUNT(*) FROM %s WHERE id <= ? GROUP BY 1' % table,
+                                      (state.get(table, 0),)):
+            days[day] = days.get(day, 0) + n
+    return days
+
+
+def _write_rows(outdir, dataset, table, rows, fmt):
+    ext = 'parquet' if fmt == 'parquet' else 'arrow'
+    for day, day_rows in _by_day(rows).items():
+        data = snapshot_table(day_rows) if dataset == 'snapshots' else long_table(dataset, day_rows)
+        name = 'part-%s-%d-%d.%s' % (table, day_rows[0][0], rows[-1][0], ext)
+        write_table(data, os.path.join(outdir, dataset, 'date=' + day, name), fmt)
+
+
+def _rewrite_day(db, outdir, tables, state, day, fmt, chunk):
+    """Replace the snapshot files of `day` with the rows now in the DB; returns the row count."""
+    partition = os.path.join(outdir, 'snapshots', 'date=' + day)
+    for path in glob.glob(os.path.join(partition, '*.parquet')) + glob.glob(os.path.join(partition, '*.arrow')):
+        os.remove(path)
+    n = 0
+    for table in tables:
+        for rows in _chunks(db, table, 0, chunk, day=day):
+            rows = [row for row in rows if row[0] <= state.get(table, 0)]
+            if rows:
+                _write_rows(outdir, 'snapshots', table, rows, fmt)
+                n += len(rows)
+    return n
+
+
+def run_export(db_path, outdir, fmt='parquet', chunk=DEFAULT_CHUNK):
+    """Append all rows added since the last export and rewrite the snapshot
+    days that lost rows. Returns {dataset: rows exported}."""
+    _require_pyarrow()
+    os.makedirs(outdir, exist_ok=True)
+    state = load_state(outdir)
+
+    db = DBManager(db_path)
+    db.connect(readonly=True)
+    counts = {}
+    try:
+        present = _existing_tables(db)
+        snapshot_tables = [t for t in DBManager.SNAPSHOT_TABLES if t in present]
+        # a day with fewer rows left than exported had snapshots replaced by
+        # backfill (new ids) or deleted; it is written again after the append
+        exported = _snapshot_days(db, snapshot_tables, state)
+        days = state.setdefault('snapshot_days', exported)
+        dirty = set(state.get('dirty_days', ())) | {day for day, n in days.items() if exported.get(day, 0) < n}
+        state['dirty_days'] = sorted(dirty)
+        save_state(outdir, state)
+
+        for table in snapshot_tables + [t for t in ('measurements', 'derived') if t in present]:
+            dataset = 'snapshots' if table in DBManager.SNAPSHOT_TABLES else table
+            for rows in _chunks(db, table, state.get(table, 0), chunk):
+                last_id = rows[-1][0]
+                if dataset == 'snapshots':
+                    for row in rows:
+                        days[row[1][:10]] = days.get(row[1][:10], 0) + 1
+                    rows = [row for row in rows if row[1][:10] not in dirty]
+                if rows:
+                    _write_rows(outdir, dataset, table, rows, fmt)
+                    counts[dataset] = counts.get(dataset, 0) + len(rows)
+                # the checkpoint only moves after the chunk's files are in place
+                state[table] = last_id
+                save_state(outdir, state)
+
+        for day in sorted(dirty):
+            n = _rewrite_day(db, outdir, snapshot_tables, state, day, fmt, chunk)
+            if n:
+                days[day] = n
+                counts['snapshots'] = counts.get('snapshots', 0) + n
+            else:
+                days.pop(day, None)
+            dirty.discard(day)
+            state['dirty_days'] = sorted(dirty)
+            save_state(outdir, state)
+    finally:
+        db.close()
+    return counts
+
+
+def compact(outdir, fmt='parquet'):
+    """Merge the part files of every day partition into one time-sorted file."""
+    _require_pyarrow()
+    import pyarrow as pa
+
+    ext = 'parquet' if fmt == 'parquet' else 'arrow'
+    merged = 0
+    for partition in sorted(glob.glob(os.path.join(outdir, '*', 'date=*'))):
+        parts = sorted(glob.glob(os.path.join(partition, '*.' + ext)))
+        if len(parts) < 2:
+            continue
+        tables = [read_table(p, fmt) for p in parts]
+        table = pa.concat_tables(tables, promote_options='default').sort_by('ts')
+        target = os.path.join(partition, 'compacted-%s.%s' % (datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f'), ext))
+        write_table(table, target, fmt)
+        for p in parts:
+            os.remove(p)
+        merged += 1
+    return merged
+
+
+def main():
+    p = argparse.ArgumentParser(description='Export the collector DB to Parquet/Arrow day partitions')
+    p.add_argument('--db', default='data/resol_data.db', help='SQLite DB path')
+    p.add_argument('--out', default='export', help='output directory (default "export")')
+    p.add_argument('--format', choices=('parquet', 'arrow'), default='parquet', help='file format (default parquet)')
+    p.add_argument('--chunk', type=int, default=DEFAULT_CHUNK, help='rows read from the DB per chunk')
+    p.add_argument('--compact', action='store_true', help='merge the files of each day partition after exporting')
+    args = p.parse_args()
+
+    counts = run_export(args.db, args.out, fmt=args.format, chunk=args.chunk)
+    for dataset, n in sorted(counts.items()):
+        print(f'Exported {n} {dataset} rows')
+    if not counts:
+        print('Nothing new to export')
+    if args.compact:
+        print(f'Compacted {compact(args.out, fmt=args.format)} day partitions')
+
+
+if __name__ == '__main__':
+    main()
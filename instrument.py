@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""Lightweight timers and counters for the read/decode/store hot path.
+
+Usage at a call site:
+
+    t0 = instrument.start()
+    ...work...
+    instrument.stop('septet', t0)
+
+`start()` returns 0.0 while instrumentation is disabled and `stop()` returns
+immediately for a zero start time, so a disabled site costs two function
+calls. `stop()` returns a fresh start time, which lets consecutive sections
+be chained without another `start()`.
+
+Timings use the monotonic `time.perf_counter` clock and are kept as log2
+histograms of microseconds. `stats()` returns a snapshot dict,
+`write_stats()` appends it as a JSON line to a rotating log file (never to
+stdout, which carries the JSON output of `resol.py`). Gauges (`gauge()`,
+e.g. the memory figures of memguard.py) hold the last reported value and are
+recorded even while timers are disabled.
+
+Signals (after `install_signal_handlers()`):
+- SIGUSR1 toggles instrumentation on/off at runtime.
+- SIGUSR2 starts a cProfile + tracemalloc capture; the next SIGUSR2 stops it
+  and writes `profile-<ts>.pstats` and `tracemalloc-<ts>.txt` next to the log.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import signal
+import time
+from datetime import datetime
+
+enabled = False
+
+_histograms = {}
+_counters = {}
+_gauges = {}
+_logger = None
+_log_path = None
+_profile = None
+# whether the running capture started tracemalloc (memguard.py may own it)
+_profile_trace = False
+
+# bucket i holds durations of < 2**i microseconds (bucket 0: below 1 us)
+BUCKETS = 32
+
+
+class Histogram:
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, p):
+        """Upper bound (seconds) of the bucket holding the p-th percentile."""
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min((1 << i) / 1e6, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total_s': self.total,
+            'mean_us': self.total / self.count * 1e6 if self.count else 0.0,
+            'min_us': (self.min or 0.0) * 1e6,
+            'max_us': self.max * 1e6,
+            'p50_us': self.percentile(50) * 1e6,
+            'p99_us': self.percentile(99) * 1e6,
+            'buckets_us': {str(1 << i): n for i, n in enumerate(self.buckets) if n},
+        }
+
+
+def enable(on=True):
+    global enabled
+    enabled = bool(on)
+
+
+def start():
+    return time.perf_counter() if enabled else 0.0
+
+
+def stop(name, t0):
+    if not t0:
+        return 0.0
+    t1 = time.perf_counter()
+    h = _histograms.get(name)
+    if h is None:
+        h = _histograms[name] = Histogram()
+    h.add(t1 - t0)
+    return t1
+
+
+def count(name, n=1):
+    if enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def gauge(name, value):
+    """Set the current value of `name`; kept until the next `gauge()` call."""
+    _gauges[name] = value
+
+
+def stats():
+    """Return {'timers': {name: histogram}, 'counters': {name: n}}, plus
+    'gauges': {name: value} once any gauge was set."""
+    result = {
+        'timers': {name: h.as_dict() for name, h in sorted(_histograms.items())},
+        'counters': dict(sorted(_counters.items())),
+    }
+    if _gauges:
+        result['gauges'] = dict(sorted(_gauges.items()))
+    return result
+
+
+def reset():
+    _histograms.clear()
+    _counters.clear()
+    _gauges.clear()
+
+
+def setup_log(path, max_bytes=1024 * 1024, backups=3):
+    """Write `write_stats()` output to a rotating log file at `path`."""
+    global _logger, _log_path
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger = logging.getLogger('resol.instrument')
+    logger.handlers[:] = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    _logger = logger
+    _log_path = path
+
+
+def write_stats(reset_after=False):
+    """Append the current stats as one JSON line to the rotating log."""
+    if _logger is None or not (_histograms or _counters or _gauges):
+        return
+    record = {'ts': datetime.utcnow().isoformat() + 'Z'}
+    record.update(stats())
+    _logger.info(json.dumps(record))
+    if reset_after:
+        # gauges are current values, not accumulated since the last write
+        _histograms.clear()
+        _counters.clear()
+
+
+def _profile_dir():
+    return os.path.dirname(_log_path) if _log_path else '.'
+
+
+def start_profile():
+    global _profile, _profile_trace
+    import cProfile
+    import tracemalloc
+
+    if _profile is not None:
+        return
+    _profile_trace = not tracemalloc.is_tracing()
+    if _profile_trace:
+        tracemalloc.start()
+    _profile = cProfile.Profile()
+    _profile.enable()
+
+
+def stop_profile():
+    """Stop a running capture and write its results. Returns the written paths."""
+    global _profile, _profile_trace
+    import tracemalloc
+
+    if _profile is None:
+        return []
+    _profile.disable()
+    stamp = datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
+    directory = _profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    pstats_path = os.path.join(directory, f'profile-{stamp}.pstats')
+    _profile.dump_stats(pstats_path)
+    _profile = None
+
+    snapshot = tracemalloc.take_snapshot()
+    if _profile_trace:
+        tracemalloc.stop()
+        _profile_trace = False
+    mem_path = os.path.join(directory, f'tracemalloc-{stamp}.txt')
+    with open(mem_path, 'w', encoding='utf-8') as f:
+        for stat in snapshot.statistics('lineno')[:50]:
+            f.write(str(stat) + '\n')
+    return [pstats_path, mem_path]
+
+
+def _on_toggle(signum, frame):
+    enable(not enabled)
+
+
+def _on_profile(signum, frame):
+    if _profile is None:
+        start_profile()
+    else:
+        stop_profile()
+
+
+def install_signal_handlers():
+    """SIGUSR1 toggles instrumentation, SIGUSR2 starts/stops a profile capture."""
+    if not hasattr(signal, 'SIGUSR1'):
+        return
+    signal.signal(signal.SIGUSR1, _on_toggle)
+    signal.signal(signal.SIGUSR2, _on_profile)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Latest decoded values in a memory-mapped file for local readers.
+
+The collector publishes every new snapshot into a fixed-layout file
+(default /dev/shm/resol-latest, i.e. RAM). Local consumers such as a display
+read the current values with a plain `mmap` in microseconds, without
+starting `resol.py`, connecting to the device or opening the database.
+
+File layout (little-endian):
+
+    0   8s  magic b'RESOLLV1'
+    8   Q   sequence counter (odd while the writer is updating)
+    16  d   unix time of the last update
+    24  I   number of fields n
+    28  I   length of the layout JSON
+    32  ..  layout JSON: [[device, field, unit, kind], ...], padded to 8 bytes
+    ..  nd  current values as float64, NaN until a value was received
+
+The layout is derived from the spec (every field of every packet), so slot
+positions are fixed for the lifetime of the file. As in snapshot_codec.py,
+kind is 'i' for fields without a factor, which `decode_fields` prints as
+integers ("12"), and 'f' otherwise ("21.5"). Consistency uses a
+seqlock: the writer makes the counter odd, writes, and makes it even again;
+a reader retries while the counter is odd or changed during its copy.
+
+Reader usage (no spec, config or DB needed):
+
+    import latest
+    ts, values = latest.read_latest()      # values[device][field] -> float
+
+or from a shell, printing the same JSON shape as `resol.py`:
+
+    python3 latest.py [/dev/shm/resol-latest]
+"""
+
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+MAGIC = b'RESOLLV2'
+HEADER = struct.Struct('<8sQdII')
+SEQ = struct.Struct('<Q')
+SEQ_OFFSET = 8
+TS_OFFSET = 16
+
+
+def default_path() -> str:
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'resol-latest')
+
+
+def layout_from_spec(spec: Dict) -> List[List[str]]:
+    """Return [[device, field, unit, kind], ...] for all fields of all packets in `spec`."""
+    from parser import get_source_name
+
+    layout = []
+    for packet in spec.get('packet', []):
+        device = get_source_name(packet['source'].lower())
+        for field in packet.get('field', []):
+            layout.append([device, field['name'][0], field.get('unit', ''), 'f' if 'factor' in field else 'i'])
+    return layout
+
+
+def _values_offset(layout_len: int) -> int:
+    return (HEADER.size + layout_len + 7) & ~7
+
+
+class LatestWriter:
+    def __init__(self, path: str, layout: List[List[str]]):
+        from db import parse_value_and_unit
+
+        self._parse_value = parse_value_and_unit
+        self.path = path
+        self.layout = layout
+        self.slots = {(entry[0], entry[1]): i for i, entry in enumerate(layout)}
+        layout_json = json.dumps(layout, ensure_ascii=False).encode('utf-8')
+        self.values_offset = _values_offset(len(layout_json))
+        self.values = struct.Struct('<%dd' % len(layout))
+        size = self.values_offset + self.values.size
+
+        # build the file aside and rename it into place, so readers never map
+        # a half-initialised file
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(b'\0' * size)
+        fd = os.open(tmp, os.O_RDWR)
+        try:
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self.mm, 0, MAGIC, 0, 0.0, len(layout), len(layout_json))
+        self.mm[HEADER.size:HEADER.size + len(layout_json)] = layout_json
+        self.current = [math.nan] * len(layout)
+        self.values.pack_into(self.mm, self.values_offset, *self.current)
+        self.seq = 0
+        os.replace(tmp, path)
+
+    def publish(self, snapshot: Dict[str, Dict[str, str]], ts: Optional[float] = None):
+        """Update the slots of all fields in `snapshot` (value strings as parsed)."""
+        for device, fields in snapshot.items():
+            for name, raw in fields.items():
+                i = self.slots.get((device, name))
+                if i is None:
+                    continue
+                value, _unit = self._parse_value(raw)
+                self.current[i] = math.nan if value is None else value
+
+        mm = self.mm
+        self.seq += 1
+        SEQ.pack_into(mm, SEQ_OFFSET, self.seq)
+        struct.pack_into('<d', mm, TS_OFFSET, time.time() if ts is None else ts)
+        self.values.pack_into(mm, self.values_offset, *self.current)
+        self.seq += 1
+        SEQ.pack_into(mm, SEQ_OFFSET, self.seq)
+
+    def close(self):
+        self.mm.close()
+
+
+class LatestReader:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_path()
+        self.mm = None
+        self.inode = None
+
+    def _open(self):
+        self.close()
+        with open(self.path, 'rb') as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _seq, _ts, n, layout_len = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a latest-values file' % self.path)
+        self.layout = json.loads(self.mm[HEADER.size:HEADER.size + layout_len].decode('utf-8'))
+        self.values_offset = _values_offset(layout_len)
+        self.values = struct.Struct('<%dd' % n)
+
+    def read_raw(self, retries: int = 1000) -> Tuple[float, Tuple[float, ...]]:
+        """Return (ts, values in layout order) as one consistent copy."""
+        if self.mm is None or os.stat(self.path).st_ino != self.inode:
+            # first use, or the writer re-created the file (new layout)
+            self._open()
+        mm = self.mm
+        for _ in range(retries):
+            seq = SEQ.unpack_from(mm, SEQ_OFFSET)[0]
+            if seq & 1:
+                continue
+            ts = struct.unpack_from('<d', mm, TS_OFFSET)[0]
+            values = self.values.unpack_from(mm, self.values_offset)
+            if SEQ.unpack_from(mm, SEQ_OFFSET)[0] == seq:
+                return ts, values
+        raise TimeoutError('no consistent read of %s' % self.path)
+
+    def read(self) -> Tuple[float, Dict[str, Dict[str, float]]]:
+        """Return (ts, {device: {field: value}}) without fields never received."""
+        ts, values = self.read_raw()
+        out = {}
+        for (device, field, *_rest), value in zip(self.layout, values):
+            if value == value:  # skip NaN
+                out.setdefault(device, {})[field] = value
+        return ts, out
+
+    def read_strings(self) -> Dict[str, Dict[str, str]]:
+        """Return values formatted like `resol.py` output ("21.5°C", "100%")."""
+        _ts, values = self.read_raw()
+        out = {}
+        for (device, field, unit, *kind), value in zip(self.layout, values):
+            if value == value:
+                out.setdefault(device, {})[field] = (str(int(value)) if kind == ['i'] else str(value)) + unit
+        return out
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+
+def read_latest(path: Optional[str] = None) -> Tuple[float, Dict[str, Dict[str, float]]]:
+    reader = LatestReader(path)
+    try:
+        return reader.read()
+    finally:
+        reader.close()
+
+
+if __name__ == '__main__':
+    reader = LatestReader(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(json.dumps(reader.read_strings()))
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""Load-test the collector ingest path against a fleet of simulated adapters.
+
+Starts simulator.py adapters in-process (or connects to a running simulator
+with `--connect HOST`), opens one `lan` transport per adapter and runs the
+collector's continuous ingest path for each: `StreamDecoder` (sync and
+checksum validation, split into cycles at the probes), `decode_packets`, then
+batched `insert_measurements` by a single DB writer thread, as a central
+ingest host would.
+
+Reported at the end:
+- ingest throughput: cycles, packets and bytes per second while reading
+- DB writer throughput: stored values per second, including the time the
+  writer needs to drain its backlog after the readers stop
+- latency from the probe send time in the simulator to decoded and to
+  committed in the DB (p50/p95/p99/max)
+- cycles lost (corruption hits the probe or drops whole messages) and the
+  largest writer backlog; a growing backlog means the host cannot keep up
+
+Run as:
+  python3 loadtest.py --adapters 50 --rate 1 --duration 60
+  python3 loadtest.py --adapters 200 --rate 2 --source spec --corrupt 0.01 --db /tmp/load.db
+  python3 loadtest.py --connect 127.0.0.1 --adapters 50 --duration 300
+"""
+
+import argparse
+import os
+import queue
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import collector
+import instrument
+import simulator
+import spec
+import transport
+from db import DBManager, parse_value_and_unit
+from parser import decode_packets
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+    return {'p50': pick(50), 'p95': pick(95), 'p99': pick(99), 'max': values[-1]}
+
+
+class Reader(threading.Thread):
+    """Ingest one adapter stream the way `collector.run_continuous` does."""
+
+    def __init__(self, label: str, address, password: str, out: queue.Queue, stop: threading.Event):
+        super().__init__(name='reader-' + label, daemon=True)
+        self.label = label
+        self.address = address
+        self.password = password
+        self.out = out
+        self.stop_event = stop
+        self.dev = None
+        self.bytes = 0
+        self.packets = 0
+        self.probes = 0
+        self.reconnects = 0
+        self.decode_latency = []
+
+    def connect(self):
+        self.dev = transport.open_lan(self.address, self.password)
+        self.dev.settimeout(0.5)
+
+    def emit(self, ts: str, packets: Dict, sent: float = None):
+        """Decode one cycle and hand it to the writer."""
+        if not packets and sent is None:
+            return
+        parsed = decode_packets(packets) if packets else {}
+        self.packets += len(packets)
+        if sent is not None:
+            self.probes += 1
+            self.decode_latency.append(time.time() - sent)
+        self.out.put((self.label, ts, parsed, sent))
+
+    def run(self):
+        stream = collector.StreamDecoder()
+        while not self.stop_event.is_set():
+            if self.dev is None:
+                try:
+                    self.connect()
+                except OSError:
+                    time.sleep(0.5)
+                    continue
+                stream = collector.StreamDecoder()
+            try:
+                chunk = collector.read_chunk(self.dev)
+            except OSError:
+                # connection reset or broken pipe: same as a closed connection
+                chunk = None
+            if chunk is None:
+                self.dev.close()
+                self.dev = None
+                self.reconnects += 1
+                continue
+            self.bytes += len(chunk)
+            # a slow reader gets several cycles per read: split them at the
+            # probes so every cycle and its latency is counted
+            ts = datetime.utcnow().isoformat() + 'Z'
+            packets, sent = {}, None
+            for key, payload in stream.feed_messages(chunk):
+                if key == simulator.PROBE:
+                    self.emit(ts, packets, sent)
+                    packets, sent = {}, simulator.probe_time(payload)
+                else:
+                    packets[key] = payload
+            self.emit(ts, packets, sent)
+        if self.dev is not None:
+            self.dev.close()
+
+
+class Writer(threading.Thread):
+    """Single DB writer committing decoded values in batches."""
+
+    def __init__(self, db_path: str, inbox: queue.Queue, stop: threading.Event, batch: int = 2000,
+                 flush_interval: float = 1.0):
+        super().__init__(name='db-writer', daemon=True)
+        self.db_path = db_path
+        self.inbox = inbox
+        self.stop_event = stop
+        self.batch = batch
+        self.flush_interval = flush_interval
+        self.values = 0
+        self.commits = 0
+        self.max_backlog = 0
+        self.commit_latency = []
+
+    def run(self):
+        db = DBManager(self.db_path)
+        db.connect()
+        rows, probes = [], []
+        flushed = time.time()
+        try:
+            while not (self.stop_event.is_set() and self.inbox.empty()):
+                self.max_backlog = max(self.max_backlog, self.inbox.qsize())
+                try:
+                    label, ts, parsed, sent = self.inbox.get(timeout=0.1)
+                except queue.Empty:
+                    label = None
+                if label is not None:
+                    for device, fields in parsed.items():
+                        for name, raw in fields.items():
+                            value, unit = parse_value_and_unit(raw)
+                            rows.append((ts, label + '/' + device, name, value, unit))
+                    if sent is not None:
+                        probes.append(sent)
+                if rows and (len(rows) >= self.batch or time.time() - flushed >= self.flush_interval):
+                    db.insert_measurements(rows)
+                    flushed = time.time()
+                    self.commit_latency.extend(flushed - sent for sent in probes)
+                    self.values += len(rows)
+                    self.commits += 1
+                    rows, probes = [], []
+            if rows:
+                db.insert_measurements(rows)
+                self.commit_latency.extend(time.time() - sent for sent in probes)
+                self.values += len(rows)
+                self.commits += 1
+        finally:
+            db.close()
+
+
+def run_loadtest(addresses, duration: float, db_path: str, password: str = 'vbus', batch: int = 2000,
+                 flush_interval: float = 1.0) -> Dict:
+    """Ingest from every address for `duration` seconds and return the measurements."""
+    stop = threading.Event()
+    inbox = queue.Queue()
+    readers = [Reader('adapter-%d' % port, (host, port), password, inbox, stop) for host, port in addresses]
+    for reader in readers:
+        reader.connect()
+    writer = Writer(db_path, inbox, stop, batch=batch, flush_interval=flush_interval)
+    writer.start()
+    started = time.time()
+    for reader in readers:
+        reader.start()
+    time.sleep(duration)
+    stop.set()
+    for reader in readers:
+        reader.join(5)
+    ingested = time.time()
+    writer.join(30)
+    drained = time.time()
+
+    decode_latency = [s for reader in readers for s in reader.decode_latency]
+    return {
+        'adapters': len(readers),
+        # readers stop after `ingest_s`; the writer then commits its backlog
+        'ingest_s': ingested - started,
+        'drain_s': drained - ingested,
+        'cycles': sum(r.probes for r in readers),
+        'packets': sum(r.packets for r in readers),
+        'bytes': sum(r.bytes for r in readers),
+        'values': writer.values,
+        'commits': writer.commits,
+        'reconnects': sum(r.reconnects for r in readers),
+        'max_backlog': writer.max_backlog,
+        'decode_latency_s': percentiles(decode_latency),
+        'commit_latency_s': percentiles(writer.commit_latency),
+    }
+
+
+def print_report(result: Dict, sent: Dict = None):
+    t = result['ingest_s']
+    print(f"{result['adapters']} adapters, {t:.1f} s ingest + {result['drain_s']:.1f} s writer drain, "
+          f"{result['commits']} commits, {result['reconnects']} reconnects, max writer backlog {result['max_backlog']}")
+    print(f"ingest:     {result['cycles'] / t:10.1f} cycles/s  {result['packets'] / t:10.1f} packets/s  "
+          f"{result['bytes'] / t / 1024:8.1f} KiB/s")
+    print(f"DB writer:  {result['values'] / (t + result['drain_s']):10.1f} values/s")
+    if sent is not None:
+        lost = sent['cycles'] - result['cycles']
+        print(f"sent {sent['cycles']} cycles ({sent['corrupted']} corrupted messages), "
+              f"{lost} cycles without a valid probe")
+    for name in ('decode_latency_s', 'commit_latency_s'):
+        p = result[name]
+        print(f"{name[:-2].replace('_', ' '):16s} p50 {p['p50'] * 1e3:8.1f} ms  p95 {p['p95'] * 1e3:8.1f} ms  "
+              f"p99 {p['p99'] * 1e3:8.1f} ms  max {p['max'] * 1e3:8.1f} ms")
+
+
+def main():
+    p = argparse.ArgumentParser(description='Measure collector ingest throughput and latency against simulated adapters')
+    simulator.add_traffic_arguments(p)
+    p.add_argument('--duration', type=float, default=30.0, help='seconds to ingest (default 30)')
+    p.add_argument('--connect', default=None, metavar='HOST',
+                   help='use a running simulator.py on HOST instead of starting adapters in-process')
+    p.add_argument('--db', default=None, help='SQLite DB to write (default: temporary file)')
+    p.add_argument('--batch', type=int, default=2000, help='values per DB transaction (default 2000)')
+    p.add_argument('--flush', type=float, default=1.0, help='seconds between DB commits at most (default 1)')
+    p.add_argument('--stats', action='store_true', help='also print the instrument timers of the ingest path')
+    args = p.parse_args()
+
+    instrument.enable(args.stats)
+    if args.source == 'spec':
+        # decode with the spec the traffic was generated from
+        spec.spec, spec.spec_hash = spec.load_spec(args.spec)
+    fleet = None
+    if args.connect:
+        addresses = [(args.connect, args.base_port + i) for i in range(args.adapters)]
+    else:
+        fleet = simulator.fleet_from_args(args)
+        fleet.start_thread()
+        addresses = fleet.addresses
+
+    tmpdir = None
+    db_path = args.db
+    if db_path is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmpdir.name, 'loadtest.db')
+    try:
+        result = run_loadtest(addresses, args.duration, db_path, password=args.password, batch=args.batch,
+                              flush_interval=args.flush)
+    finally:
+        if fleet is not None:
+            fleet.stop_thread()
+    print_report(result, fleet.stats() if fleet is not None else None)
+    if args.stats:
+        for name, h in instrument.stats()['timers'].items():
+            print(f"  {name:10s} n={h['count']:8d}  mean {h['mean_us']:8.1f} us  p99 {h['p99_us']:8.1f} us")
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
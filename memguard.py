@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Periodic memory self-checks for long-running processes.
+
+`MemGuard.check()` samples the process every `interval` seconds and exposes
+the figures as instrument gauges, so they land in the stats log with every
+`instrument.write_stats()`:
+
+- rss_kb:          current resident set size (/proc/self/statm)
+- rss_peak_kb:     peak resident set size (getrusage)
+- py_heap_kb:      memory traced by tracemalloc (only with `trace=True`)
+- py_heap_peak_kb: tracemalloc peak since the previous check
+
+With `trace=True` every check also logs the allocation sites that grew most
+since the previous check to the stats log. Above `limit_mb` it prints a
+warning and counts 'memory_limit'. The last `history` samples are kept for
+trend checks (see `growth()` and soak.py).
+
+Configured by `memory_check_interval`, `memory_limit_mb` and `memory_trace`
+in config.py.
+"""
+
+import collections
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import instrument
+
+_PAGE_KB = os.sysconf('SC_PAGE_SIZE') // 1024 if hasattr(os, 'sysconf') else 4
+
+
+def rss_kb() -> int:
+    """Current resident set size in KiB (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_KB
+    except (OSError, IndexError, ValueError):
+        return peak_rss_kb()
+
+
+def peak_rss_kb() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def growth(samples: Sequence[Tuple[float, float]]) -> float:
+    """Least-squares slope of (time s, value) samples, in value units per hour."""
+    n = len(samples)
+    if n < 2:
+        return 0.0
+    mean_t = sum(t for t, _ in samples) / n
+    mean_v = sum(v for _, v in samples) / n
+    var = sum((t - mean_t) ** 2 for t, _ in samples)
+    if not var:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in samples) / var * 3600.0
+
+
+class MemGuard:
+    def __init__(self, interval: float = 300.0, limit_mb: float = 0, trace: bool = False, top: int = 5,
+                 history: int = 1024):
+        self.interval = interval
+        self.limit_kb = limit_mb * 1024
+        self.trace = trace
+        self.top = top
+        self.samples = collections.deque(maxlen=history)
+        self.checked_at = None
+        self._snapshot = None
+        self._started_trace = False
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_trace = True
+
+    @classmethod
+    def from_config(cls, config) -> 'MemGuard':
+        return cls(
+            interval=getattr(config, 'memory_check_interval', 300),
+            limit_mb=getattr(config, 'memory_limit_mb', 0),
+            trace=getattr(config, 'memory_trace', False),
+        )
+
+    def due(self, now: float) -> bool:
+        return self.interval > 0 and (self.checked_at is None or now - self.checked_at >= self.interval)
+
+    def maybe_check(self, now: Optional[float] = None) -> Optional[Dict]:
+        now = time.time() if now is None else now
+        return self.check(now) if self.due(now) else None
+
+    def check(self, now: Optional[float] = None) -> Dict:
+        """Sample memory now, update the gauges and return the sample."""
+        now = time.time() if now is None else now
+        self.checked_at = now
+        sample = {'rss_kb': rss_kb(), 'rss_peak_kb': peak_rss_kb()}
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            sample['py_heap_kb'] = current // 1024
+            sample['py_heap_peak_kb'] = peak // 1024
+        for name, value in sample.items():
+            instrument.gauge(name, value)
+        self.samples.append((now, sample))
+
+        growing = self._top_growth() if self.trace else []
+        if growing:
+            logging.getLogger('resol.instrument').info(json.dumps({'memory': sample, 'top_growth': growing}))
+        if self.limit_kb and sample['rss_kb'] > self.limit_kb:
+            instrument.count('memory_limit')
+            print(f"Memory warning: RSS {sample['rss_kb'] / 1024:.1f} MB above limit {self.limit_kb / 1024:.0f} MB",
+                  file=sys.stderr)
+        return sample
+
+    def _top_growth(self) -> List[str]:
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        previous, self._snapshot = self._snapshot, snapshot
+        if previous is None:
+            return []
+        return [str(stat) for stat in snapshot.compare_to(previous, 'lineno')[:self.top] if stat.size_diff > 0]
+
+    def series(self, name: str) -> List[Tuple[float, float]]:
+        """(time, value) samples of one figure, e.g. 'rss_kb'."""
+        return [(t, sample[name]) for t, sample in self.samples if name in sample]
+
+    def close(self):
+        self._snapshot = None
+        if self._started_trace:
+            tracemalloc.stop()
+            self._started_trace = False
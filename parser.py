@@ -3,14 +3,21 @@
 
 Public API:
 - parse_raw_bytes(raw_bytes) -> dict
+- extract_packets(raw_bytes) -> {(destination, source, command): payload}
+- decode_packets(packets) -> dict (memoized per spec version and packet)
+- pack_packets(packets) / unpack_packets(blob) for storing raw payloads
 
 This module re-implements the parsing parts of `resol.py` to allow
 offline parsing of captured binary files.
 """
 
-from typing import Dict
+import struct
+import sys
+from functools import lru_cache
+from typing import Dict, List, Tuple
 import spec
 import config
+import instrument
 
 
 def bytes_to_int(b):
@@ -47,8 +54,9 @@ def gb(data: bytes, begin: int, end: int) -> int:
     segment = data[begin:end]
     wbg = sum([0xff << (i * 8) for i, b in enumerate(segment)])
     s = sum([b << (i * 8) for i, b in enumerate(segment)])
-    if s >= wbg / 2:
-        s = -1 * (wbg - s)
+    if segment and s >= wbg / 2:
+        # two's complement: 0xFFFF is -1, 0x8000 is -32768
+        s = -1 * (wbg + 1 - s)
     return s
 
 
@@ -60,7 +68,10 @@ def get_compare_length(mask: str) -> int:
 
 
 def get_source_name_from_msg(msg: bytes) -> str:
-    src = format_byte(msg[3]) + format_byte(msg[2])[2:]
+    return get_source_name(format_byte(msg[3]) + format_byte(msg[2])[2:])
+
+
+def get_source_name(src: str) -> str:
     for device in spec.spec.get('device', []):
         if src[:get_compare_length(device['mask'])].lower() == device['address'][:get_compare_length(device['mask'])].lower():
             return device['name'] if get_compare_length(device['mask']) == 7 else str(device['name']).replace('#', device['address'][get_compare_length(device['mask']) - 1:], 1)
@@ -102,40 +113,191 @@ def get_command(msg: bytes) -> str:
     return format_byte(msg[6]) + format_byte(msg[5:6])[2:]
 
 
+# Specialised decoders generated from the spec by codegen.py when
+# config.codegen is set: {(destination, source, command): (device name, fn(payload))},
+# valid for the spec whose hash is `fast_spec_hash`.
+fast_decoders = {}
+fast_spec_hash = None
+
+
+def get_fast_decoders() -> Dict:
+    """Return the generated decoders for the loaded spec ({} if codegen is off)."""
+    if fast_spec_hash != spec.spec_hash:
+        if not getattr(config, 'codegen', False):
+            return {}
+        import codegen
+        codegen.install()
+    return fast_decoders
+
+
 def parse_message(msg: bytes, result: Dict):
     # Only PV1 is parsed into fields currently
     if get_protocolversion(msg) != 'PV1':
         return
 
+    t0 = instrument.start()
     payload = get_payload(msg)
+    t0 = instrument.stop('septet', t0)
     if config.debug:
-        print('Parsing payload length', len(payload))
+        print('Parsing payload length', len(payload), file=sys.stderr)
+
+    fast = get_fast_decoders()
+    if fast:
+        entry = fast.get((msg[0] | msg[1] << 8, msg[2] | msg[3] << 8, msg[5] | msg[6] << 8))
+        if entry is not None:
+            t0 = instrument.stop('match', t0)
+            result[entry[0]] = entry[1](payload)
+            instrument.stop('fields', t0)
+            return
 
     for packet in spec.spec.get('packet', []):
         if packet['source'].lower() == get_source(msg).lower() and packet['destination'].lower() == get_destination(msg).lower() and packet['command'].lower() == get_command(msg).lower():
+            t0 = instrument.stop('match', t0)
             name = get_source_name_from_msg(msg)
-            result[name] = {}
-            for field in packet.get('field', []):
-                offset = int(field['offset'])
-                bit_size = int(field['bitSize'])
-                length = (bit_size + 1) // 8
-                val = gb(payload, offset, offset + length)
-                factor = float(field['factor']) if 'factor' in field else 1
-                unit = field['unit'] if 'unit' in field else ''
-                result[name][field['name'][0]] = str(val * factor) + unit
+            result[name] = decode_fields(packet, payload)
+            t0 = instrument.stop('fields', t0)
+
+
+def decode_fields(packet: Dict, payload: bytes) -> Dict[str, str]:
+    fields = {}
+    for field in packet.get('field', []):
+        offset = int(field['offset'])
+        bit_size = int(field['bitSize'])
+        length = (bit_size + 1) // 8
+        val = gb(payload, offset, offset + length)
+        factor = float(field['factor']) if 'factor' in field else 1
+        unit = field['unit'] if 'unit' in field else ''
+        fields[field['name'][0]] = str(val * factor) + unit
+    return fields
 
 
 def parse_raw_bytes(raw: bytes) -> Dict:
     """Parse raw bytes (may contain multiple messages / sync bytes) and return result dict."""
     result = {}
+    t0 = instrument.start()
     parts = raw.split(b'\xAA')
     # take the message parts (non-empty middle parts)
     msgs = [p for p in parts if p]
+    instrument.stop('sync', t0)
+    instrument.count('messages', len(msgs))
     for msg in msgs:
         # msg here is the chunk after 0xAA and before next 0xAA
         try:
             parse_message(msg, result)
         except Exception:
             # be tolerant of malformed frames
+            instrument.count('malformed')
+            continue
+    return result
+
+
+def calc_checksum(data: bytes) -> int:
+    """VBus checksum: 0x7F minus the sum of all bytes, 7 bits wide."""
+    crc = 0x7F
+    for b in data:
+        crc = (crc - b) & 0x7F
+    return crc
+
+
+# longest PV1 message after the sync byte: header and 127 frames
+MAX_MESSAGE = 9 + 127 * 6
+
+
+def extract_messages(raw: bytes) -> List[Tuple[Tuple[int, int, int], bytes]]:
+    """Return [((destination, source, command), payload), ...] for every
+    checksum-validated PV1 message in `raw`, in stream order.
+
+    Unlike `extract_packets`, repeated packets are all kept, e.g. several
+    cycles of a controller read at once.
+    """
+    messages = []
+    t0 = instrument.start()
+    for msg in raw.split(b'\xAA'):
+        if len(msg) < 9 or msg[4] != 0x10 or calc_checksum(msg[:8]) != msg[8]:
+            continue
+        frame_count = msg[7]
+        end = 9 + frame_count * 6
+        # every byte after the sync byte has its top bit clear; the 7-bit
+        # checksums cannot detect a flipped bit 7, so check it explicitly
+        if len(msg) < end or max(msg[:end]) >= 0x80:
+            instrument.count('malformed')
+            continue
+        payload = bytearray()
+        for i in range(frame_count):
+            frame = msg[9 + i * 6:15 + i * 6]
+            if calc_checksum(frame[:5]) != frame[5]:
+                instrument.count('malformed')
+                break
+            payload += integrate_septett(frame)
+        else:
+            messages.append(((msg[0] | msg[1] << 8, msg[2] | msg[3] << 8, msg[5] | msg[6] << 8), bytes(payload)))
+    instrument.stop('extract', t0)
+    return messages
+
+
+def extract_packets(raw: bytes) -> Dict[Tuple[int, int, int], bytes]:
+    """Return the checksum-validated PV1 payloads in `raw`.
+
+    Keys are (destination, source, command) as integers; when a packet was
+    received several times the last valid copy wins. No spec lookup or value
+    formatting happens here, which keeps the ingest path cheap.
+    """
+    return dict(extract_messages(raw))
+
+
+_PACKET_HEADER = struct.Struct('<HHHH')
+
+
+def pack_packets(packets: Dict[Tuple[int, int, int], bytes]) -> bytes:
+    """Serialise packets as repeated (destination, source, command, length, payload)."""
+    out = bytearray()
+    for (destination, source, command), payload in packets.items():
+        out += _PACKET_HEADER.pack(destination, source, command, len(payload))
+        out += payload
+    return bytes(out)
+
+
+def unpack_packets(blob: bytes) -> Dict[Tuple[int, int, int], bytes]:
+    packets = {}
+    pos = 0
+    while pos < len(blob):
+        destination, source, command, length = _PACKET_HEADER.unpack_from(blob, pos)
+        pos += _PACKET_HEADER.size
+        packets[(destination, source, command)] = blob[pos:pos + length]
+        pos += length
+    return packets
+
+
+@lru_cache(maxsize=1024)
+def _decode_packet(spec_hash: str, destination: int, source: int, command: int, payload: bytes):
+    # spec_hash is part of the cache key only: a reloaded (corrected) spec
+    # never reuses values decoded with the old one
+    entry = get_fast_decoders().get((destination, source, command))
+    if entry is not None:
+        return entry[0], entry[1](payload)
+    src = '0x%04x' % source
+    dst = '0x%04x' % destination
+    cmd = '0x%04x' % command
+    for packet in spec.spec.get('packet', []):
+        if packet['source'].lower() == src and packet['destination'].lower() == dst and packet['command'].lower() == cmd:
+            return get_source_name(src), decode_fields(packet, payload)
+    return None
+
+
+def decode_packets(packets: Dict[Tuple[int, int, int], bytes]) -> Dict:
+    """Decode packets from `extract_packets` into the same dict as `parse_raw_bytes`.
+
+    Decoding is memoized per (spec version, packet), so repeated payloads,
+    e.g. unchanged values across many stored snapshots, are decoded once.
+    """
+    result = {}
+    for (destination, source, command), payload in packets.items():
+        try:
+            decoded = _decode_packet(spec.spec_hash, destination, source, command, payload)
+        except Exception:
+            # same tolerance as parse_raw_bytes, e.g. spec fields without an offset
+            instrument.count('malformed')
             continue
+        if decoded is not None:
+            result[decoded[0]] = dict(decoded[1])
     return result
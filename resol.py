@@ -6,6 +6,8 @@ import socket
 import sys
 import json
 
+import instrument
+
 # Load settings
 try:
     import config
@@ -71,27 +73,32 @@ def load_data():
 
     while len(result) < config.expected_packets:
         buf = readstream()
+        t0 = instrument.start()
         msgs = splitmsg(buf)
+        instrument.stop('sync', t0)
+        instrument.count('messages', len(msgs))
         if config.debug:
-            print(str(len(msgs)) + " Messages, " + str(len(result)) + " Resultlen")
+            print(str(len(msgs)) + " Messages, " + str(len(result)) + " Resultlen", file=sys.stderr)
         for msg in msgs:
             if config.debug:
-                print(get_protocolversion(msg))
+                print(get_protocolversion(msg), file=sys.stderr)
             if "PV1" == get_protocolversion(msg):
                 if config.debug:
-                    print(format_message_pv1(msg))
+                    print(format_message_pv1(msg), file=sys.stderr)
                 parse_payload(msg)
             elif "PV2" == get_protocolversion(msg):
                 if config.debug:
-                    print(format_message_pv2(msg))
+                    print(format_message_pv2(msg), file=sys.stderr)
 
 
 def recv():
     # return bytes
+    t0 = instrument.start()
     if config.connection == "serial" or config.connection == "stdin":
         dat = sock.read(1024)
     else:
         dat = sock.recv(1024)
+    instrument.stop('read', t0)
     return dat
 
 
@@ -100,9 +107,20 @@ def send(dat):
     sock.send(dat)
 
 
+# longest PV1 message after the sync byte: header and 127 frames
+MAX_MESSAGE = 9 + 127 * 6
+
+
 def readstream():
+    limit = getattr(config, 'max_buffer', 64 * 1024)
     data = recv()
     while data.count(b'\xAA') < 4:
+        if len(data) > limit:
+            # noise without sync bytes (e.g. a bad serial line): keep at most
+            # one possible message start and resync on the following bytes
+            cut = data.rfind(b'\xAA', len(data) - MAX_MESSAGE)
+            data = data[cut:] if cut >= 0 else b''
+            instrument.count('overflow')
         data += recv()
     return data
 
@@ -159,13 +177,16 @@ def get_payload(msg):
 
 
 def parse_payload(msg):
+    t0 = instrument.start()
     payload = get_payload(msg)
+    t0 = instrument.stop('septet', t0)
 
     if config.debug:
-        print('ParsePacket Payload ' + str(len(payload)))
+        print('ParsePacket Payload ' + str(len(payload)), file=sys.stderr)
 
     for packet in spec.spec['packet']:
         if packet['source'].lower() == get_source(msg).lower() and packet['destination'].lower() == get_destination(msg).lower() and packet['command'].lower() == get_command(msg).lower():
+            t0 = instrument.stop('match', t0)
             result[get_source_name(msg)] = {}
             for field in packet['field']:
                 offset = int(field['offset'])
@@ -175,6 +196,7 @@ def parse_payload(msg):
                 factor = float(field['factor']) if 'factor' in field else 1
                 unit = field['unit'] if 'unit' in field else ''
                 result[get_source_name(msg)][field['name'][0]] = str(val * factor) + unit
+            t0 = instrument.stop('fields', t0)
 
 
 def format_message_pv1(msg):
@@ -237,12 +259,17 @@ def gb(data, begin, end):  # GetBytes
     segment = data[begin:end]
     wbg = sum([0xff << (i * 8) for i, b in enumerate(segment)])
     s = sum([b << (i * 8) for i, b in enumerate(segment)])
-    if s >= wbg / 2:
-        s = -1 * (wbg - s)
+    if segment and s >= wbg / 2:
+        # two's complement: 0xFFFF is -1, 0x8000 is -32768
+        s = -1 * (wbg + 1 - s)
     return s
 
 
 if __name__ == '__main__':
+    if getattr(config, 'instrument', False):
+        instrument.enable()
+        instrument.setup_log(config.instrument_log)
+
     if config.connection == "serial":
         sock = serial.Serial(config.port, baudrate=config.baudrate, timeout=0)
     elif config.connection == "lan":
@@ -259,6 +286,7 @@ if __name__ == '__main__':
     load_data()
 
     print(json.dumps(result))
+    instrument.write_stats()
 
     if config.connection == "lan":
         try:
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Per-field storage scheduling for the continuous collector.
+
+In continuous mode (`collector.py --continuous`) the device stream is decoded
+as it arrives (typically one packet per second), and every decoded value is
+offered to `Scheduler.observe()`. Each field has a policy:
+
+- min: never store the field more often than every `min` seconds
+- max: always store it at least every `max` seconds (heartbeat)
+- deadband: store it earlier than `max` when it moved by more than
+  `deadband` since the last stored value
+
+Without a configured deadband it is derived from the observed variance:
+`auto_k` times the exponentially weighted mean absolute sample-to-sample
+change. Noisy fields then only store real moves, fast-changing fields such
+as pump speed or collector temperature are stored as often as `min` allows,
+and constant fields (SW-Version, operating hours) only on change or
+heartbeat.
+
+Policies come from `config.schedule_rules`, a dict of fnmatch patterns
+matched against the field name or "device/field" (first match wins), with
+`config.schedule_default` as the fallback. Selected rows are buffered and
+written in one transaction every `flush_interval` seconds or `batch_size`
+rows to the `measurements` table.
+"""
+
+import fnmatch
+from typing import Dict, List, Optional, Tuple
+
+from db import parse_value_and_unit
+
+DEFAULT_POLICY = {'min': 30.0, 'max': 300.0, 'deadband': None}
+AUTO_K = 2.0
+# weight of a new sample in the running mean absolute change
+EWMA_ALPHA = 0.1
+
+
+class FieldState:
+    __slots__ = ('policy', 'last_value', 'last_stored', 'stored_at', 'mean_change')
+
+    def __init__(self, policy: Dict):
+        self.policy = policy
+        self.last_value = None
+        self.last_stored = None
+        self.stored_at = None
+        self.mean_change = 0.0
+
+
+class Scheduler:
+    def __init__(self, rules: Optional[Dict[str, Dict]] = None, default: Optional[Dict] = None,
+                 flush_interval: float = 60.0, batch_size: int = 500, auto_k: float = AUTO_K):
+        self.rules = list((rules or {}).items())
+        self.default = dict(DEFAULT_POLICY, **(default or {}))
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.auto_k = auto_k
+        self.fields = {}
+        self.pending = []
+        self.flushed_at = None
+        self.observed = 0
+
+    @classmethod
+    def from_config(cls, config) -> 'Scheduler':
+        return cls(
+            rules=getattr(config, 'schedule_rules', {}),
+            default=getattr(config, 'schedule_default', {}),
+            flush_interval=getattr(config, 'schedule_flush', 60.0),
+        )
+
+    def policy_for(self, device: str, field: str) -> Dict:
+        qualified = device + '/' + field
+        for pattern, policy in self.rules:
+            if fnmatch.fnmatchcase(field, pattern) or fnmatch.fnmatchcase(qualified, pattern):
+                return dict(self.default, **policy)
+        return self.default
+
+    def deadband(self, state: FieldState) -> float:
+        configured = state.policy.get('deadband')
+        if configured is not None:
+            return configured
+        return self.auto_k * state.mean_change
+
+    def observe(self, now: float, ts: str, snapshot: Dict[str, Dict[str, str]]):
+        """Offer one decoded snapshot taken at `now` (unix seconds, ISO `ts`)."""
+        self.observed += 1
+        for device, fields in snapshot.items():
+            for name, raw in fields.items():
+                value, unit = parse_value_and_unit(raw)
+                if value is None:
+                    continue
+                key = (device, name)
+                state = self.fields.get(key)
+                if state is None:
+                    state = self.fields[key] = FieldState(self.policy_for(device, name))
+                if state.last_value is not None:
+                    state.mean_change += EWMA_ALPHA * (abs(value - state.last_value) - state.mean_change)
+                state.last_value = value
+
+                if state.stored_at is not None:
+                    elapsed = now - state.stored_at
+                    if elapsed < state.policy['min']:
+                        continue
+                    if elapsed < state.policy['max'] and abs(value - state.last_stored) <= self.deadband(state):
+                        continue
+                state.stored_at = now
+                state.last_stored = value
+                self.pending.append((ts, device, name, value, unit))
+
+    def due(self, now: float) -> bool:
+        if self.flushed_at is None:
+            self.flushed_at = now
+        return len(self.pending) >= self.batch_size or bool(self.pending and now - self.flushed_at >= self.flush_interval)
+
+    def take(self, now: float) -> List[Tuple[str, str, str, float, Optional[str]]]:
+        """Return and clear the buffered rows."""
+        rows, self.pending = self.pending, []
+        self.flushed_at = now
+        return rows
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""Simulate a fleet of VBus/LAN adapters on localhost.
+
+Each virtual adapter listens on its own port and speaks the protocol
+`resol.login()` and the `lan` transport expect:
+
+    -> +HELLO
+    <- PASS <password>      -> +OK: Password accepted / -ERROR: Password rejected
+    <- DATA                 -> +OK: Data incoming...  then raw VBus bytes
+    <- QUIT                 -> +OK, connection closed
+
+After DATA the adapter sends one cycle (the full packet set of a controller)
+`rate` times per second. Cycles come from recorded captures (`--source
+captures`, the distinct valid messages of each .bin file, rotated) or from
+random spec payloads built with vbusgen (`--source spec`). With `--corrupt P`
+every message is damaged with probability P (bit flip, truncation or line
+noise), which a correct receiver must drop without losing the rest.
+
+Unless disabled, every cycle starts with a probe message carrying the send
+time (unix microseconds) at the PROBE address, which no spec uses; loadtest.py
+uses it to measure end-to-end latency.
+
+Run as:
+  python3 simulator.py --adapters 50 --base-port 17053 --rate 1 --source captures
+  python3 simulator.py --adapters 200 --rate 5 --source spec --spec spec/DeltaSolBXPlus.json --corrupt 0.01
+"""
+
+import argparse
+import asyncio
+import glob
+import random
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import parser
+import vbusgen
+
+# (destination, source, command) of the latency probe
+PROBE = (0x0000, 0x7E7E, 0x0F01)
+
+
+def probe_message(sent: float) -> bytes:
+    return vbusgen.build_pv1_message(*PROBE, int(sent * 1e6).to_bytes(8, 'little'))
+
+
+def probe_time(payload: bytes) -> float:
+    """Send time (unix seconds) carried by a probe payload."""
+    return int.from_bytes(payload[:8], 'little') / 1e6
+
+
+def _messages(packets: Dict[Tuple[int, int, int], bytes]) -> List[bytes]:
+    return [vbusgen.build_pv1_message(*key, payload) for key, payload in packets.items()]
+
+
+def cycles_from_captures(pattern: str = 'captures/*.bin') -> List[List[bytes]]:
+    """One cycle per capture file: its distinct valid messages."""
+    cycles = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'rb') as f:
+            packets = parser.extract_packets(f.read())
+        if packets:
+            cycles.append(_messages(packets))
+    if not cycles:
+        raise ValueError('no valid messages in %s' % pattern)
+    return cycles
+
+
+def cycles_from_spec(spec_file: str, count: int = 16, seed: int = 0) -> List[List[bytes]]:
+    """`count` cycles with random payloads for every packet of `spec_file`."""
+    import spec
+    loaded, _hash = spec.load_spec(spec_file)
+    rng = random.Random(seed)
+    return [[vbusgen.build_pv1_message(*vbusgen.packet_address(packet), vbusgen.random_payload(packet, rng))
+             for packet in loaded['packet']] for _ in range(count)]
+
+
+def corrupt(msg: bytes, rng: random.Random) -> bytes:
+    """Damage one message: flip a bit, cut it short or add line noise."""
+    kind = rng.randrange(3)
+    if kind == 0:
+        data = bytearray(msg)
+        data[rng.randrange(1, len(data))] ^= 1 << rng.randrange(8)
+        return bytes(data)
+    if kind == 1:
+        return msg[:rng.randrange(1, len(msg))]
+    return bytes(rng.getrandbits(8) for _ in range(rng.randrange(1, 32))) + msg
+
+
+class Adapter:
+    """One virtual adapter; counters are read by the load-test driver."""
+
+    def __init__(self, fleet: 'Fleet', index: int):
+        self.fleet = fleet
+        self.index = index
+        # base port 0: every adapter gets a free port from the OS
+        self.port = fleet.base_port + index if fleet.base_port else 0
+        self.rng = random.Random(fleet.seed * 7919 + index)
+        self.server = None
+        self.connections = 0
+        self.cycles = 0
+        self.bytes = 0
+        self.corrupted = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.fleet.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        authorized = False
+        try:
+            writer.write(b'+HELLO\n')
+            await writer.drain()
+            while True:
+                line = (await reader.readline()).strip()
+                if not line:
+                    return
+                command, _, argument = line.partition(b' ')
+                command = command.upper()
+                if command == b'PASS':
+                    authorized = argument.decode('ascii', 'replace') == self.fleet.password
+                    writer.write(b'+OK: Password accepted\n' if authorized else b'-ERROR: Password rejected\n')
+                elif command == b'DATA':
+                    if not authorized:
+                        writer.write(b'-ERROR: Not authorized\n')
+                    else:
+                        writer.write(b'+OK: Data incoming...\n')
+                        await self.stream(writer)
+                        return
+                elif command == b'QUIT':
+                    writer.write(b'+OK\n')
+                    await writer.drain()
+                    return
+                else:
+                    writer.write(b'-ERROR: Unknown command\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # client gone, or the fleet is shutting down
+            pass
+        finally:
+            writer.close()
+
+    async def stream(self, writer: asyncio.StreamWriter):
+        fleet = self.fleet
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / fleet.rate
+        # spread adapters over the interval instead of sending in lockstep
+        due = loop.time() + self.rng.random() * interval
+        position = self.rng.randrange(len(fleet.cycles))
+        while True:
+            await asyncio.sleep(max(0.0, due - loop.time()))
+            messages = fleet.cycles[position % len(fleet.cycles)]
+            position += 1
+            if fleet.probe:
+                messages = [probe_message(time.time())] + messages
+            if fleet.corruption:
+                damaged = []
+                for msg in messages:
+                    if self.rng.random() < fleet.corruption:
+                        msg = corrupt(msg, self.rng)
+                        self.corrupted += 1
+                    damaged.append(msg)
+                messages = damaged
+            data = b''.join(messages)
+            writer.write(data)
+            await writer.drain()
+            self.cycles += 1
+            self.bytes += len(data)
+            due += interval
+            if due < loop.time() - interval:
+                # fell behind (slow reader): skip instead of bursting
+                due = loop.time()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+
+class Fleet:
+    def __init__(self, cycles: List[List[bytes]], adapters: int = 10, rate: float = 1.0, corruption: float = 0.0,
+                 host: str = '127.0.0.1', base_port: int = 17053, password: str = 'vbus', probe: bool = True,
+                 seed: int = 0):
+        self.cycles = cycles
+        self.rate = rate
+        self.corruption = corruption
+        self.host = host
+        self.base_port = base_port
+        self.password = password
+        self.probe = probe
+        self.seed = seed
+        self.adapters = [Adapter(self, i) for i in range(adapters)]
+        self.loop = None
+        self.thread = None
+
+    @property
+    def addresses(self) -> List[Tuple[str, int]]:
+        return [(self.host, adapter.port) for adapter in self.adapters]
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        for adapter in self.adapters:
+            await adapter.start()
+
+    def start_thread(self):
+        """Run the fleet on its own event loop thread; returns once all ports listen."""
+        started = threading.Event()
+        errors = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.start())
+            except Exception as e:
+                errors.append(e)
+                started.set()
+                return
+            started.set()
+            loop.run_forever()
+            for adapter in self.adapters:
+                adapter.close()
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+
+        self.thread = threading.Thread(target=run, name='vbus-fleet', daemon=True)
+        self.thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+
+    def stop_thread(self):
+        if self.loop is not None and self.thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(5)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'connections': sum(a.connections for a in self.adapters),
+            'cycles': sum(a.cycles for a in self.adapters),
+            'bytes': sum(a.bytes for a in self.adapters),
+            'corrupted': sum(a.corrupted for a in self.adapters),
+        }
+
+
+def add_traffic_arguments(p: argparse.ArgumentParser):
+    p.add_argument('--adapters', type=int, default=10, help='number of virtual adapters (default 10)')
+    p.add_argument('--base-port', type=int, default=17053, help='port of the first adapter, the others follow (default 17053)')
+    p.add_argument('--rate', type=float, default=1.0, help='cycles per second and adapter (default 1)')
+    p.add_argument('--source', choices=('captures', 'spec'), default='captures', help='traffic source (default captures)')
+    p.add_argument('--captures', default='captures/*.bin', help='capture files for --source captures')
+    p.add_argument('--spec', default='spec/DeltaSolSLL.json', help='spec file for --source spec')
+    p.add_argument('--corrupt', type=float, default=0.0, help='probability that a message is corrupted (default 0)')
+    p.add_argument('--password', default='vbus', help='adapter password (default "vbus")')
+    p.add_argument('--no-probe', action='store_true', help='do not send latency probe messages')
+    p.add_argument('--seed', type=int, default=0, help='random seed for payloads and corruption')
+
+
+def fleet_from_args(args, host: str = '127.0.0.1') -> Fleet:
+    if args.source == 'captures':
+        cycles = cycles_from_captures(args.captures)
+    else:
+        cycles = cycles_from_spec(args.spec, seed=args.seed)
+    return Fleet(cycles, adapters=args.adapters, rate=args.rate, corruption=args.corrupt, host=host,
+                 base_port=args.base_port, password=args.password, probe=not args.no_probe, seed=args.seed)
+
+
+def main():
+    p = argparse.ArgumentParser(description='Run virtual VBus/LAN adapters on localhost')
+    add_traffic_arguments(p)
+    p.add_argument('--host', default='127.0.0.1', help='listen address (default 127.0.0.1)')
+    args = p.parse_args()
+
+    fleet = fleet_from_args(args, host=args.host)
+
+    async def run():
+        await fleet.start()
+        print(f'{args.adapters} adapters on {args.host}:{args.base_port}-{args.base_port + args.adapters - 1}, '
+              f'{args.rate} cycles/s, corruption {args.corrupt}')
+        while True:
+            await asyncio.sleep(10)
+            s = fleet.stats()
+            print(f"connections {s['connections']}  cycles {s['cycles']}  bytes {s['bytes']}  corrupted {s['corrupted']}")
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
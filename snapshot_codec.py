@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Compact binary encoding of parsed snapshots.
+
+A snapshot `{device: {field: "21.5°C", ...}, ...}` is split into a layout and
+a value blob:
+
+- layout: list of [device, field, unit, kind] in snapshot order, where kind is
+  'f' (value text is `repr(float)`) or 'i' (value text is an integer). The
+  layout only changes when the spec or the set of reporting devices changes,
+  so it is stored once per distinct layout, keyed by its SHA-1 hash.
+- blob: one flag byte followed by the values as little-endian float64; the
+  values are zlib-compressed when that is smaller (flag 1, else flag 0).
+
+Decoding re-creates the exact original strings. Snapshots whose values cannot
+be reproduced exactly (non-numeric text, integers beyond 2**53) are reported
+by `encode` returning None, and the caller stores them as JSON instead.
+
+A DeltaSol SLL snapshot shrinks from ~950 bytes of JSON to ~60 bytes.
+"""
+
+import hashlib
+import json
+import re
+import struct
+import zlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+_NUMBER = re.compile(r'^(-?\d+(?:\.\d+)?(?:e[-+]\d+)?)(.*)$', re.S)
+
+RAW = 0
+ZLIB = 1
+
+
+def _split_value(text):
+    """Return (number, unit, kind) if `text` can be rebuilt exactly, else None."""
+    if not isinstance(text, str):
+        return None
+    m = _NUMBER.match(text)
+    if not m:
+        return None
+    num_text, unit = m.group(1), m.group(2)
+    if '.' in num_text or 'e' in num_text:
+        value = float(num_text)
+        if repr(value) != num_text:
+            return None
+        return value, unit, 'f'
+    value = int(num_text)
+    if abs(value) > 2 ** 53 or str(value) != num_text:
+        return None
+    return float(value), unit, 'i'
+
+
+def layout_hash(layout: List[List[str]]) -> str:
+    return hashlib.sha1(json.dumps(layout, ensure_ascii=False, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def encode(snapshot: Dict[str, Dict[str, str]]) -> Optional[Tuple[List[List[str]], bytes]]:
+    """Encode a snapshot into (layout, blob), or None if it is not representable."""
+    layout = []
+    values = []
+    for device, fields in snapshot.items():
+        for name, text in fields.items():
+            split = _split_value(text)
+            if split is None:
+                return None
+            value, unit, kind = split
+            layout.append([device, name, unit, kind])
+            values.append(value)
+
+    packed = struct.pack('<%dd' % len(values), *values)
+    compressed = zlib.compress(packed, 9)
+    if len(compressed) < len(packed):
+        return layout, bytes([ZLIB]) + compressed
+    return layout, bytes([RAW]) + packed
+
+
+@lru_cache(maxsize=64)
+def _decoder(layout_json: str):
+    """Compile a layout into (struct, [(device, field, unit, kind), ...])."""
+    layout = [tuple(entry) for entry in json.loads(layout_json)]
+    return struct.Struct('<%dd' % len(layout)), layout
+
+
+def decode(layout_json: str, blob: bytes) -> Dict[str, Dict[str, str]]:
+    """Decode a blob written by `encode` using the layout stored as JSON text."""
+    unpacker, layout = _decoder(layout_json)
+    packed = zlib.decompress(blob[1:]) if blob[0] == ZLIB else blob[1:]
+    snapshot = {}
+    for (device, name, unit, kind), value in zip(layout, unpacker.unpack(packed)):
+        fields = snapshot.get(device)
+        if fields is None:
+            fields = snapshot[device] = {}
+        fields[name] = (str(int(value)) if kind == 'i' else repr(value)) + unit
+    return snapshot
@@ -1,27 +1,39 @@
 #!/usr/bin/env python3
 
 __author__ = 'Tim'
+import hashlib
 import json
 import sys
 import config
 
+
+def load_spec(path):
+    """Load a JSON spec file and return (spec dict, spec hash).
+
+    The hash is the SHA-1 of the file contents and identifies the spec
+    version, so stored data can tell which spec it was decoded with.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    data = json.loads(content.decode('utf-8'))
+    return data['vbusSpecification'], hashlib.sha1(content).hexdigest()
+
+
 # Load given specFile. Specfile was created from original
 # RESOL Configuration File XML shipped with RSC (Resol Service Center)
 # using XML to JSON converter at http://www.utilities-online.info/xmltojson
-with open(config.spec_file, 'r', encoding='utf-8') as f:
-    data = json.load(f)
-    try:
-        spec = data['vbusSpecification']
-    except Exception:
-        sys.exit('Cannot load Spec')
+try:
+    spec, spec_hash = load_spec(config.spec_file)
+except Exception:
+    sys.exit('Cannot load Spec')
 
 if config.debug:
     for device in spec.get('device', []):
-        print(device)
+        print(device, file=sys.stderr)
 
     for packet in spec.get('packet', []):
-        print(packet)
+        print(packet, file=sys.stderr)
         for field in packet.get('field', []):
-            print("  " + str(field))
+            print("  " + str(field), file=sys.stderr)
 
 #json_data.close()
@@ -0,0 +1,63 @@
+import shutil
+import sqlite3
+
+import backfill
+
+
+def test_backfill_is_idempotent(tmp_path):
+    src = tmp_path / 'captures'
+    src.mkdir()
+    for name in ('capture-2025-11-19T15-55-41Z.bin', 'capture-2025-11-19T15-56-14Z.bin'):
+        shutil.copy('captures/' + name, src / name)
+    db_path = str(tmp_path / 'db' / 'resol.db')
+
+    assert backfill.run_backfill(str(src), db_path, workers=1) == 2
+    # second run finds everything up to date
+    assert backfill.run_backfill(str(src), db_path, workers=1) == 0
+    # forced run replaces the snapshots instead of duplicating them
+    assert backfill.run_backfill(str(src), db_path, workers=1, force=True) == 2
+
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('SELECT ts FROM snapshots ORDER BY ts').fetchall()
+    conn.close()
+    assert rows == [('2025-11-19T15:55:41Z',), ('2025-11-19T15:56:14Z',)]
+
+
+def test_backfill_from_tar_gz_matches_directory(tmp_path):
+    import glob
+    import tarfile
+
+    names = sorted(glob.glob('captures/capture-*.bin'))
+    archive = tmp_path / 'captures.tar.gz'
+    with tarfile.open(archive, 'w:gz') as tf:
+        for name in names + ['captures/manifest.json']:
+            tf.add(name)
+
+    tar_db = str(tmp_path / 'tar.db')
+    dir_db = str(tmp_path / 'dir.db')
+    assert backfill.run_backfill(str(archive), tar_db, workers=2, chunk_size=3) == len(names)
+    assert backfill.run_backfill(str(archive), tar_db, workers=2, chunk_size=3) == 0
+    assert backfill.run_backfill('captures', dir_db, workers=1) == len(names)
+
+    def snapshots(path):
+        conn = sqlite3.connect(path)
+        rows = conn.execute('SELECT ts, data FROM snapshots ORDER BY ts').fetchall()
+        conn.close()
+        return rows
+
+    assert snapshots(tar_db) == snapshots(dir_db)
+
+
+def test_captures_without_timestamp_are_checkpointed(tmp_path):
+    src = tmp_path / 'captures'
+    src.mkdir()
+    shutil.copy('captures/capture-2025-11-19T15-56-14Z.bin', src / 'unnamed.bin')
+    db_path = str(tmp_path / 'resol.db')
+
+    assert backfill.run_backfill(str(src), db_path, workers=1) == 1
+    # recorded without a snapshot, so the next run does not decode it again
+    assert backfill.run_backfill(str(src), db_path, workers=1) == 0
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT file, snapshot_id FROM backfill_progress').fetchall() == [('unnamed.bin', None)]
+    assert conn.execute('SELECT COUNT(*) FROM snapshots').fetchone()[0] == 0
+    conn.close()
@@ -0,0 +1,208 @@
+"""Conformance and fuzz tests for the VBus frame decoder.
+
+Valid frames are generated for every packet of every spec in `spec/` and
+decoded both by the parser and by the straightforward reference decoder
+below, which follows the protocol description and shares no code with
+`parser.py`. Every decoder in DECODERS must agree with the reference bit for
+bit; optimised decoders are registered there.
+
+The fuzz tests feed random, truncated and bit-flipped streams and check that
+decoding never raises, never hangs and never accepts a corrupted payload.
+"""
+
+import hashlib
+import random
+import time
+
+import pytest
+
+import codegen
+import config
+import parser
+import spec
+import vbusgen
+
+CATALOGUE = vbusgen.load_catalogue()
+ROUNDS = 25
+
+
+def codegen_decode_fields(packet, payload):
+    return codegen.compile_packet(packet)(payload)
+
+
+# field decoders under test: (packet, payload) -> {field name: value string}
+DECODERS = [parser.decode_fields, codegen_decode_fields]
+
+
+def reference_checksum(data):
+    return (0x7F - sum(data)) & 0x7F
+
+
+def reference_extract(msg):
+    """Decode one PV1 message (starting with 0xAA) into ((dst, src, cmd), payload)."""
+    assert msg[0] == 0xAA
+    header = msg[1:10]
+    assert reference_checksum(header[:8]) == header[8]
+    destination = header[0] + 256 * header[1]
+    source = header[2] + 256 * header[3]
+    command = header[5] + 256 * header[6]
+    payload = bytearray()
+    for i in range(header[7]):
+        frame = msg[10 + 6 * i:16 + 6 * i]
+        assert reference_checksum(frame[:5]) == frame[5]
+        for j in range(4):
+            payload.append(frame[j] + (128 if frame[4] & (1 << j) else 0))
+    return (destination, source, command), bytes(payload)
+
+
+def reference_fields(packet, payload):
+    out = {}
+    for field in packet['field']:
+        offset = int(field['offset'])
+        size = (int(field['bitSize']) + 1) // 8
+        value = int.from_bytes(payload[offset:offset + size], 'little', signed=True)
+        factor = float(field['factor']) if 'factor' in field else 1
+        out[field['name'][0]] = str(value * factor) + field.get('unit', '')
+    return out
+
+
+def catalogue_id(entry):
+    return entry[0].rsplit('/', 1)[-1]
+
+
+@pytest.fixture(params=CATALOGUE, ids=catalogue_id)
+def spec_entry(request, monkeypatch):
+    path, loaded = request.param
+    monkeypatch.setattr(spec, 'spec', loaded)
+    monkeypatch.setattr(spec, 'spec_hash', hashlib.sha1(path.encode('utf-8')).hexdigest())
+    return loaded
+
+
+@pytest.fixture(params=['generic', 'codegen'])
+def decode_mode(request, monkeypatch, tmp_path):
+    """Run parse_raw_bytes/decode_packets with and without generated decoders."""
+    monkeypatch.setattr(config, 'codegen', request.param == 'codegen')
+    # keep the decoder cache out of the source tree
+    monkeypatch.setattr(config, 'spec_file', str(tmp_path / 'spec.json'))
+    codegen.uninstall()
+    yield request.param
+    codegen.uninstall()
+
+
+def test_catalogue_is_not_empty():
+    assert len(CATALOGUE) >= 5
+
+
+@pytest.mark.parametrize('decoder', DECODERS, ids=lambda d: d.__name__)
+def test_generated_frames_match_reference(spec_entry, decoder, decode_mode):
+    rng = random.Random(0x5EED)
+    for packet in spec_entry['packet']:
+        key = vbusgen.packet_address(packet)
+        for _ in range(ROUNDS):
+            payload = vbusgen.random_payload(packet, rng)
+            msg = vbusgen.build_pv1_message(*key, payload)
+
+            assert reference_extract(msg) == (key, payload)
+            assert parser.extract_packets(msg) == {key: payload}
+
+            try:
+                expected = reference_fields(packet, payload)
+            except (KeyError, ValueError):
+                # packet the parser cannot decode (compound field, '0,01' factor):
+                # it must be skipped, not crash the stream
+                with pytest.raises((KeyError, ValueError)):
+                    decoder(packet, payload)
+                assert parser.decode_packets({key: payload}) == {}
+                continue
+
+            assert decoder(packet, payload) == expected
+            name = parser.get_source_name(packet['source'].lower())
+            assert parser.parse_raw_bytes(msg) == {name: expected}
+            assert parser.decode_packets({key: payload}) == {name: expected}
+
+
+def test_septet_and_sign_extremes():
+    payload = bytes([0xFF, 0xFF, 0x00, 0x80, 0x7F, 0xFF, 0x80, 0x00])
+    msg = vbusgen.build_pv1_message(0x0010, 0x2271, 0x0100, payload)
+    # no byte after the sync byte may have its top bit set
+    assert max(msg[1:]) < 0x80
+    assert parser.extract_packets(msg)[(0x0010, 0x2271, 0x0100)] == payload
+    assert parser.gb(payload, 0, 2) == -1
+    assert parser.gb(payload, 2, 4) == -32768
+    assert parser.gb(payload, 4, 6) == -129
+    assert parser.gb(payload, 6, 7) == -128
+
+
+def _valid_stream(rng, count=6):
+    loaded = CATALOGUE[0][1]
+    messages = []
+    for _ in range(count):
+        packet = rng.choice(loaded['packet'])
+        key = vbusgen.packet_address(packet)
+        messages.append((key, vbusgen.build_pv1_message(*key, vbusgen.random_payload(packet, rng))))
+    return messages
+
+
+def _decode_all(raw):
+    start = time.perf_counter()
+    parser.parse_raw_bytes(raw)
+    packets = parser.extract_packets(raw)
+    parser.decode_packets(packets)
+    assert time.perf_counter() - start < 1.0
+    return packets
+
+
+def test_fuzz_random_streams_never_crash():
+    rng = random.Random(1)
+    for _ in range(300):
+        raw = bytes(rng.getrandbits(8) for _ in range(rng.randrange(0, 600)))
+        _decode_all(raw)
+        # random bytes plus plenty of sync bytes
+        _decode_all(raw.replace(b'\x00', b'\xAA'))
+
+
+def test_truncated_streams_keep_only_complete_messages():
+    rng = random.Random(2)
+    messages = _valid_stream(rng)
+    stream = b''.join(msg for _key, msg in messages)
+    for cut in range(len(stream) + 1):
+        packets = _decode_all(stream[:cut])
+        expected = {}
+        pos = 0
+        for key, msg in messages:
+            pos += len(msg)
+            if pos <= cut:
+                expected[key] = reference_extract(msg)[1]
+        assert packets == expected
+
+
+def test_resync_after_garbage():
+    rng = random.Random(3)
+    for _ in range(100):
+        key, msg = _valid_stream(rng, 1)[0]
+        garbage = bytes(rng.getrandbits(8) for _ in range(rng.randrange(0, 100)))
+        packets = _decode_all(garbage + msg + garbage[:rng.randrange(0, 10)])
+        assert packets[key] == reference_extract(msg)[1]
+
+
+def test_bit_flips_are_never_accepted():
+    rng = random.Random(4)
+    _key, msg = _valid_stream(rng, 1)[0]
+    for i in range(1, len(msg)):
+        for bit in range(8):
+            corrupted = bytearray(msg)
+            corrupted[i] ^= 1 << bit
+            # 7-bit checksums miss flips of bit 7, so those must be caught by
+            # rejecting bytes >= 0x80 inside a message
+            assert _decode_all(bytes(corrupted)) == {}
+
+
+def test_codegen_cache_is_reused(tmp_path):
+    cache = codegen.cache_path(spec.spec_hash, str(tmp_path / 'spec.json'))
+    first = codegen.build(spec.spec, spec.spec_hash, cache)
+    assert cache.startswith(str(tmp_path)) and len(first) == len(spec.spec['packet'])
+    second = codegen.build(spec.spec, spec.spec_hash, cache)
+    raw = open('captures/capture-2025-11-19T15-56-14Z.bin', 'rb').read()
+    for key, payload in parser.extract_packets(raw).items():
+        if key in first:
+            assert first[key][1](payload) == second[key][1](payload)
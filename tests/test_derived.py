@@ -0,0 +1,67 @@
+import pytest
+
+from db import DBManager
+from derived import DerivedMetrics
+
+
+def snap(heat, pump, flow, t1=60.0, t2=40.0):
+    return {'dev': {
+        'Heat quantity': '%sWh' % float(heat),
+        'Pump Speed Relay 1': '%s%%' % float(pump),
+        'Flow rate V40': '%sl/h' % float(flow),
+        'Temp. Sensor 1': '%s°C' % t1,
+        'Temp. Sensor 2': '%s°C' % t2,
+    }}
+
+
+def make_engine(**kw):
+    return DerivedMetrics(counters=['Heat quantity'], on_time=['Pump Speed Relay 1'], integrals=['Flow rate V40'],
+                          differences={'dT': ('Temp. Sensor 1', 'Temp. Sensor 2')}, **kw)
+
+
+def test_counters_on_time_and_integrals():
+    m = make_engine()
+    m.update('2025-06-01T10:00:00Z', snap(1000, 100, 120))
+    out = dict(m.update('2025-06-01T10:05:00Z', snap(1100, 0, 0)))
+    assert out['Heat quantity.delta'] == 100
+    assert out['Pump Speed Relay 1.on_s'] == 300
+    assert out['Pump Speed Relay 1.duty'] == 1.0
+    assert out['Flow rate V40.integral'] == pytest.approx(5.0)  # 120 -> 0 l/h over 5 min
+    assert out['dT'] == pytest.approx(20.0)
+
+    out = dict(m.update('2025-06-01T10:10:00Z', snap(50, 0, 0)))
+    assert out['Heat quantity.delta'] == 50  # reset
+    assert out['Heat quantity.today'] == 150
+    assert out['Pump Speed Relay 1.duty'] == 0.5
+
+
+def test_wrap_gap_and_day_rollover():
+    m = make_engine(counter_modulus={'Heat quantity': 2 ** 16}, max_gap=600)
+    m.update('2025-06-01T23:50:00Z', snap(65530, 100, 60))
+    out = dict(m.update('2025-06-01T23:55:00Z', snap(4, 100, 60)))
+    assert out['Heat quantity.delta'] == 10
+    # a 1h outage is not counted as on-time, and the new day starts from zero
+    out = dict(m.update('2025-06-02T00:55:00Z', snap(14, 100, 60)))
+    assert out['Heat quantity.today'] == 10
+    assert out['Pump Speed Relay 1.on_s'] == 0
+    assert out['Flow rate V40.integral'] == 0
+
+
+def test_state_persists_with_rows(tmp_path):
+    db = DBManager(str(tmp_path / 'resol.db'))
+    m = make_engine()
+    for ts, s in (('2025-06-01T10:00:00Z', snap(10, 100, 0)), ('2025-06-01T10:05:00Z', snap(20, 100, 0))):
+        db.insert_derived(ts, m.update(ts, s), m.state)
+
+    resumed = make_engine()
+    resumed.state = db.load_derived_state()
+    out = dict(resumed.update('2025-06-01T10:10:00Z', snap(25, 0, 0)))
+    assert out['Heat quantity.today'] == 15
+    assert out['Pump Speed Relay 1.on_s'] == 600
+    assert db.conn.execute("SELECT COUNT(*) FROM derived WHERE name = 'dT'").fetchone()[0] == 2
+    db.close()
+
+
+def test_enabled_only_with_configured_metrics():
+    assert not DerivedMetrics().enabled
+    assert DerivedMetrics(differences={'dT': ('a', 'b')}).enabled
@@ -0,0 +1,103 @@
+import glob
+import json
+
+import pytest
+
+import export
+from db import DBManager, parse_value_and_unit
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+def load_capture_snapshots():
+    return [s for s in (json.load(open(f, encoding='utf-8')) for f in sorted(glob.glob('captures/capture-*.json'))) if s]
+
+
+def read_dataset(root, fmt='parquet'):
+    files = sorted(glob.glob(str(root / '**' / ('*.' + fmt)), recursive=True))
+    tables = [export.read_table(f, fmt) for f in files]
+    return pa.concat_tables(tables, promote_options='default').sort_by('ts')
+
+
+def make_db(path):
+    db = DBManager(str(path), compact=True)
+    db.connect()
+    return db
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+def test_export_is_incremental_and_typed(tmp_path, fmt):
+    snapshots = load_capture_snapshots()
+    db = make_db(tmp_path / 'resol.db')
+    db.insert_snapshot('2025-01-01T23:59:00Z', snapshots[0])
+    db.insert_snapshot('2025-01-02T00:01:00Z', snapshots[1])
+    db.insert_snapshot('2025-01-01T12:00:00Z', {'dev': {'state': 'on', 'Temp': '21.5 °C'}})
+    db.insert_measurements([('2025-01-01T12:00:00Z', 'dev', 'Temp', 21.5, '°C')])
+
+    out = tmp_path / 'export'
+    assert export.run_export(str(tmp_path / 'resol.db'), str(out), fmt=fmt, chunk=2) == {'snapshots': 3, 'measurements': 1}
+    assert sorted(p.rsplit('=', 1)[1] for p in glob.glob(str(out / 'snapshots' / 'date=*'))) == ['2025-01-01', '2025-01-02']
+    assert export.run_export(str(tmp_path / 'resol.db'), str(out), fmt=fmt) == {}
+
+    db.insert_snapshot('2025-01-02T00:02:00Z', snapshots[0])
+    db.close()
+    assert export.run_export(str(tmp_path / 'resol.db'), str(out), fmt=fmt) == {'snapshots': 1}
+
+    table = read_dataset(out / 'snapshots', fmt)
+    assert table.num_rows == 4
+    ts = [t.isoformat() for t in table.column('ts').to_pylist()]
+    assert ts == sorted(ts)
+
+    raw = snapshots[0]['DeltaSol SLL [Regler]']['Temp. Sensor 1']
+    value, unit = parse_value_and_unit(raw)
+    column = table.schema.field('DeltaSol SLL [Regler]/Temp. Sensor 1')
+    assert column.type == pa.float64() and column.metadata[b'unit'] == unit.encode('utf-8')
+    assert table.column(column.name).to_pylist()[-1] == value
+    # non-numeric values become nulls, numeric ones stay typed
+    assert table.column('dev/state').null_count == 4
+    assert table.column('dev/Temp').to_pylist() == [21.5, None, None, None]
+    assert read_dataset(out / 'measurements', fmt).column('value').to_pylist() == [21.5]
+
+
+def test_compact_merges_day_partitions(tmp_path):
+    snapshots = load_capture_snapshots()
+    db = make_db(tmp_path / 'resol.db')
+    out = tmp_path / 'export'
+    for minute in range(3):
+        db.insert_snapshot('2025-01-01T00:%02d:00Z' % (2 - minute), snapshots[minute % len(snapshots)])
+        export.run_export(str(tmp_path / 'resol.db'), str(out))
+    db.close()
+
+    before = read_dataset(out / 'snapshots')
+    assert len(glob.glob(str(out / 'snapshots' / 'date=2025-01-01' / '*.parquet'))) == 3
+    assert export.compact(str(out)) == 1
+    files = glob.glob(str(out / 'snapshots' / 'date=2025-01-01' / '*.parquet'))
+    assert len(files) == 1
+    after = pq.read_table(files[0])
+    assert after.column('ts').to_pylist() == sorted(before.column('ts').to_pylist())
+    assert after.num_rows == 3
+
+
+def test_backfill_replacement_rewrites_the_day(tmp_path):
+    snapshots = load_capture_snapshots()
+    db = make_db(tmp_path / 'resol.db')
+    db.insert_snapshot('2025-01-01T10:00:00Z', snapshots[0])
+    db.insert_backfill_batch([('a.bin', 1, '2025-01-01T11:00:00Z', '2025-01-03T00:00:00Z', snapshots[0])], 'old')
+    db.insert_snapshot('2025-01-02T10:00:00Z', snapshots[0])
+    out = tmp_path / 'export'
+    assert export.run_export(str(tmp_path / 'resol.db'), str(out)) == {'snapshots': 3}
+    assert export.compact(str(out)) == 1
+
+    # a forced re-parse deletes the snapshot and inserts it with a new id
+    db.insert_backfill_batch([('a.bin', 1, '2025-01-01T11:00:00Z', '2025-01-03T00:00:00Z', {'dev': {'Temp': '30 °C'}})], 'new')
+    db.close()
+    assert export.run_export(str(tmp_path / 'resol.db'), str(out)) == {'snapshots': 2}
+    assert export.run_export(str(tmp_path / 'resol.db'), str(out)) == {}
+
+    table = read_dataset(out / 'snapshots')
+    ts = [t.isoformat() for t in table.column('ts').to_pylist()]
+    assert len(ts) == len(set(ts)) == 3
+    assert table.column('dev/Temp').to_pylist() == [None, 30.0, None]
+    # the other day was left alone
+    assert len(glob.glob(str(out / 'snapshots' / 'date=2025-01-02' / '*.parquet'))) == 1
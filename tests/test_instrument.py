@@ -0,0 +1,30 @@
+import json
+
+import instrument
+import parser
+
+
+def test_disabled_instrumentation_records_nothing():
+    instrument.reset()
+    instrument.enable(False)
+    parser.parse_raw_bytes(open('captures/capture-2025-11-19T15-56-14Z.bin', 'rb').read())
+    assert instrument.stats() == {'timers': {}, 'counters': {}}
+
+
+def test_enabled_instrumentation_writes_histograms(tmp_path):
+    log = tmp_path / 'instrument.log'
+    instrument.reset()
+    instrument.setup_log(str(log))
+    instrument.enable()
+    try:
+        parser.parse_raw_bytes(open('captures/capture-2025-11-19T15-56-14Z.bin', 'rb').read())
+        stats = instrument.stats()
+        for name in ('sync', 'septet', 'match', 'fields'):
+            assert stats['timers'][name]['count'] > 0
+        assert stats['counters']['messages'] > 0
+        instrument.write_stats(reset_after=True)
+    finally:
+        instrument.enable(False)
+    record = json.loads(log.read_text().splitlines()[-1])
+    assert record['timers']['septet']['count'] == stats['timers']['septet']['count']
+    assert instrument.stats()['timers'] == {}
@@ -0,0 +1,64 @@
+import json
+import subprocess
+import sys
+
+import latest
+import parser
+import spec
+
+
+def capture_snapshot():
+    return parser.parse_raw_bytes(open('captures/capture-2025-11-19T15-56-14Z.bin', 'rb').read())
+
+
+def test_writer_reader_roundtrip(tmp_path):
+    path = str(tmp_path / 'latest')
+    writer = latest.LatestWriter(path, latest.layout_from_spec(spec.spec))
+    reader = latest.LatestReader(path)
+    assert reader.read() == (0.0, {})
+
+    snapshot = capture_snapshot()
+    writer.publish(snapshot, ts=1234.5)
+    ts, values = reader.read()
+    assert ts == 1234.5
+    assert values['DeltaSol SLL [Regler]']['Temp. Sensor 1'] == 21.5
+    assert reader.read_strings() == snapshot
+
+    # a re-created file (new layout) is picked up by an open reader
+    writer.close()
+    writer = latest.LatestWriter(path, [['dev', 'a', ' V']])
+    writer.publish({'dev': {'a': '1.5 V'}}, ts=1.0)
+    assert reader.read() == (1.0, {'dev': {'a': 1.5}})
+    reader.close()
+    writer.close()
+
+
+def test_reader_cli_prints_resol_json(tmp_path):
+    path = str(tmp_path / 'latest')
+    writer = latest.LatestWriter(path, latest.layout_from_spec(spec.spec))
+    writer.publish(capture_snapshot())
+    out = subprocess.run([sys.executable, 'latest.py', path], capture_output=True, check=True).stdout
+    assert json.loads(out) == capture_snapshot()
+    writer.close()
+
+
+def test_fields_without_factor_print_as_integers(tmp_path):
+    import random
+
+    import vbusgen
+
+    bx, _hash = spec.load_spec('spec/DeltaSolBX.json')
+    rng = random.Random(1)
+    snapshot = {}
+    for packet in bx['packet']:
+        device = parser.get_source_name(packet['source'].lower())
+        snapshot.setdefault(device, {}).update(parser.decode_fields(packet, vbusgen.random_payload(packet, rng)))
+
+    path = str(tmp_path / 'latest')
+    writer = latest.LatestWriter(path, latest.layout_from_spec(bx))
+    writer.publish(snapshot)
+    reader = latest.LatestReader(path)
+    # e.g. "Drehzahl Relais 1" has no factor: "100%", not "100.0%"
+    assert reader.read_strings() == snapshot
+    reader.close()
+    writer.close()
@@ -0,0 +1,84 @@
+import json
+import random
+
+import backfill
+import capture_device
+import collector
+import instrument
+import memguard
+import soak
+import vbusgen
+
+
+def noise(rng, n):
+    return bytes(rng.getrandbits(8) for _ in range(n)).replace(b'\xAA', b'\x55')
+
+
+def test_stream_decoder_buffer_is_bounded_and_resyncs():
+    rng = random.Random(0)
+    key = (0x0010, 0x2271, 0x0100)
+    msg = vbusgen.build_pv1_message(*key, bytes(range(8)))
+    stream = collector.StreamDecoder(max_buffer=4096)
+    assert stream.feed(b'\xAA' + noise(rng, 1000)) == {}
+    for _ in range(20):
+        stream.feed(noise(rng, 1000))
+        assert len(stream.buf) <= 4096
+    assert stream.feed(msg + msg) == {key: bytes(range(8))}
+
+
+def test_manifest_is_valid_json_after_every_capture(tmp_path):
+    manifest = capture_device.ManifestWriter(str(tmp_path / 'manifest.json'), '2025-11-19T16:00:00Z')
+    assert json.loads((tmp_path / 'manifest.json').read_text())['samples'] == []
+    for i in range(3):
+        name = 'capture-2025-11-19T15-5%d-00Z.bin' % i
+        (tmp_path / name).write_bytes(b'')
+        manifest.append({'file': name, 'timestamp': '2025-11-19T15:5%d:00Z' % i, 'size': 0})
+        assert len(json.loads((tmp_path / 'manifest.json').read_text())['samples']) == i + 1
+    manifest.close()
+    kind, names, timestamps = backfill.list_captures(str(tmp_path))
+    assert timestamps['capture-2025-11-19T15-52-00Z.bin'] == '2025-11-19T15:52:00Z'
+
+
+def test_memguard_reports_gauges(tmp_path):
+    instrument.reset()
+    instrument.setup_log(str(tmp_path / 'instrument.log'))
+    guard = memguard.MemGuard(interval=10, trace=True)
+    try:
+        assert guard.maybe_check(100.0)['rss_kb'] > 0
+        assert guard.maybe_check(105.0) is None
+        kept = [bytearray(1024) for _ in range(2048)]
+        sample = guard.maybe_check(110.0)
+        assert sample['py_heap_kb'] >= 2048 and kept
+    finally:
+        guard.close()
+    instrument.write_stats(reset_after=True)
+    record = json.loads((tmp_path / 'instrument.log').read_text().splitlines()[-1])
+    assert record['gauges']['rss_kb'] == sample['rss_kb']
+    # gauges survive the reset of timers and counters
+    assert instrument.stats()['gauges']['py_heap_kb'] == sample['py_heap_kb']
+    instrument.reset()
+
+
+def test_growth_is_slope_per_hour():
+    assert memguard.growth([(0, 100), (1800, 150), (3600, 200)]) == 100
+    assert memguard.growth([(t, 5) for t in range(10)]) == 0
+
+
+def test_short_soak_runs_replayed_traffic(tmp_path):
+    result = soak.run_soak(1.5, sample=0.1, workdir=str(tmp_path), tolerance_kb=64 * 1024)
+    assert result['ok'] and result['samples'] >= 10
+    assert result['heap_growth_kb'] is None
+
+
+def test_profile_capture_keeps_memguard_tracing(tmp_path):
+    import tracemalloc
+
+    instrument.setup_log(str(tmp_path / 'instrument.log'))
+    guard = memguard.MemGuard(trace=True)
+    instrument.start_profile()
+    paths = instrument.stop_profile()
+    assert len(paths) == 2
+    # the capture did not start tracemalloc, so it must not stop it
+    assert tracemalloc.is_tracing()
+    guard.close()
+    assert not tracemalloc.is_tracing()
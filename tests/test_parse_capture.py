@@ -2,6 +2,7 @@ import os
 import json
 
 import parser
+from db import DBManager
 
 
 def make_test_message():
@@ -58,3 +59,33 @@ def test_parse_synthetic_message():
     for k in result.keys():
         assert isinstance(k, str)
         assert isinstance(result[k], dict)
+
+
+def test_extract_packets_rejects_bad_checksums():
+    raw = open(os.path.join(os.path.dirname(__file__), '..', 'captures', 'capture-2025-11-19T15-56-14Z.bin'), 'rb').read()
+    msg = next(m for m in raw.split(b'\xAA') if len(m) == 123)
+    packets = parser.extract_packets(b'\xAA' + msg)
+    assert list(packets) == [(0x0010, 0x2271, 0x0100)]
+    assert len(packets[(0x0010, 0x2271, 0x0100)]) == 76
+
+    # a flipped data bit in the second frame fails its frame checksum
+    corrupted = bytearray(msg)
+    corrupted[16] ^= 0x01
+    assert parser.extract_packets(b'\xAA' + bytes(corrupted)) == {}
+    # a flipped header bit fails the header checksum
+    corrupted = bytearray(msg)
+    corrupted[5] ^= 0x01
+    assert parser.extract_packets(b'\xAA' + bytes(corrupted)) == {}
+
+
+def test_raw_snapshots_decode_lazily(tmp_path):
+    raw = open('captures/capture-2025-11-19T15-56-14Z.bin', 'rb').read()
+    packets = parser.extract_packets(raw)
+    db = DBManager(str(tmp_path / 'resol.db'))
+    db.insert_raw_snapshot('2025-01-01T00:00:00Z', packets)
+    db.insert_raw_snapshot('2025-01-01T00:05:00Z', packets)
+
+    rows = list(db.iter_snapshots())
+    assert [ts for ts, _ in rows] == ['2025-01-01T00:00:00Z', '2025-01-01T00:05:00Z']
+    assert rows[0][1] == rows[1][1] == parser.parse_raw_bytes(raw)
+    db.close()
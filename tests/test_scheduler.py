@@ -0,0 +1,145 @@
+from scheduler import Scheduler
+
+
+def run(scheduler, samples):
+    """Feed (t, snapshot) samples; return stored (t, field, value)."""
+    for t, snapshot in samples:
+        scheduler.observe(t, 't%d' % t, snapshot)
+    return [(row[0], row[2], row[3]) for row in scheduler.take(samples[-1][0])]
+
+
+def test_rates_follow_rules():
+    s = Scheduler(rules={'Pump*': {'min': 10, 'max': 60, 'deadband': 0},
+                         'SW-Version': {'min': 3600, 'max': 86400, 'deadband': 0}},
+                  default={'min': 30, 'max': 120})
+    samples = [(t, {'dev': {'Pump Speed Relay 1': '%d.0%%' % (t % 7 * 10), 'SW-Version': '1.08'}})
+               for t in range(0, 600)]
+    stored = run(s, samples)
+    pump = [t for t, f, _v in stored if f == 'Pump Speed Relay 1']
+    version = [t for t, f, _v in stored if f == 'SW-Version']
+    assert version == ['t0']
+    # changing every second: stored at the min interval
+    assert pump == ['t%d' % t for t in range(0, 600, 10)]
+
+
+def test_auto_deadband_ignores_noise_but_keeps_steps():
+    s = Scheduler(default={'min': 1, 'max': 1000})
+    samples = []
+    for t in range(400):
+        noise = 0.1 if t % 2 else 0.0
+        level = 20.0 if t < 200 else 30.0
+        samples.append((t, {'dev': {'Temp': '%.1f°C' % (level + noise)}}))
+    stored = run(s, samples)
+    times = [int(t[1:]) for t, _f, _v in stored]
+    # first value, warm-up while the noise estimate settles, then only the step
+    assert times[0] == 0
+    assert 200 in times
+    assert len([t for t in times if 50 < t < 200]) == 0
+    assert len([t for t in times if t > 210]) == 0
+
+
+def test_batches_are_flushed_by_time_or_size():
+    s = Scheduler(default={'min': 0, 'max': 0}, flush_interval=5, batch_size=4)
+    s.observe(0, 't0', {'dev': {'a': '1', 'b': '2'}})
+    assert not s.due(0)
+    assert s.due(5)
+    s.take(5)
+    s.observe(6, 't6', {'dev': {'a': '1', 'b': '2', 'c': '3', 'd': '4'}})
+    assert s.due(6)
+    assert len(s.take(6)) == 4
+
+
+class FlakyDevice:
+    """LAN-like device that sends a capture, then drops the connection."""
+
+    def __init__(self, data, fail=True):
+        self.chunks = [data[:len(data) // 2], data[len(data) // 2:] + b'\xAA']
+        self.fail = fail
+
+    def recv(self, n):
+        if self.chunks:
+            return self.chunks.pop(0)
+        if self.fail:
+            raise ConnectionResetError('connection reset by peer')
+        return b''
+
+    def close(self):
+        pass
+
+
+def test_continuous_collector_reconnects_and_flushes(tmp_path, monkeypatch):
+    import sqlite3
+    import time
+
+    import collector
+    from db import DBManager
+    from derived import DerivedMetrics
+
+    data = open('captures/capture-2025-11-19T15-56-14Z.bin', 'rb').read()
+    devices = []
+
+    def connect_device(connection=None, **options):
+        devices.append(FlakyDevice(data, fail=len(devices) == 0))
+        return devices[-1]
+
+    monkeypatch.setattr(collector, 'connect_device', connect_device)
+    monkeypatch.setattr(collector, 'RECONNECT_MIN', 0.01)
+    db = DBManager(str(tmp_path / 'resol.db'))
+    db.connect()
+    collector.run_continuous(db, 5, DerivedMetrics(), until=time.time() + 0.5)
+    db.close()
+
+    # the reset did not end the collector, and the rows buffered for the
+    # next scheduled flush were written on exit
+    assert len(devices) >= 2
+    conn = sqlite3.connect(str(tmp_path / 'resol.db'))
+    assert conn.execute('SELECT COUNT(*) FROM measurements').fetchone()[0] > 0
+    conn.close()
+
+
+class SilentDevice:
+    """LAN-like device that sends one capture, then stays connected but silent."""
+
+    def __init__(self, data):
+        self.chunks = [data + b'\xAA']
+
+    def recv(self, n):
+        import socket
+        if self.chunks:
+            return self.chunks.pop(0)
+        raise socket.timeout()
+
+    def close(self):
+        pass
+
+
+class RecordingDerived:
+    state = {}
+
+    def __init__(self):
+        self.calls = []
+
+    def update(self, ts, snapshot):
+        self.calls.append((ts, snapshot))
+        return []
+
+
+def test_continuous_derived_skips_stalled_device(tmp_path, monkeypatch):
+    import time
+
+    import collector
+    from db import DBManager
+    from parser import decode_packets, extract_packets
+
+    data = open('captures/capture-2025-11-19T15-56-14Z.bin', 'rb').read()
+    monkeypatch.setattr(collector, 'connect_device', lambda connection=None, **options: SilentDevice(data))
+    db = DBManager(str(tmp_path / 'resol.db'))
+    db.connect()
+    derived = RecordingDerived()
+    # derived interval 0.06 s: several ticks pass while the device is silent
+    collector.run_continuous(db, 0.001, derived, until=time.time() + 0.5)
+    db.close()
+
+    # one update with every packet of the capture, none for the stall
+    assert len(derived.calls) == 1
+    assert derived.calls[0][1] == decode_packets(extract_packets(data))
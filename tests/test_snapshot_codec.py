@@ -0,0 +1,43 @@
+import glob
+import json
+
+import snapshot_codec
+from db import DBManager
+
+
+def load_capture_snapshots():
+    return [json.load(open(f, encoding='utf-8')) for f in sorted(glob.glob('captures/capture-*.json'))]
+
+
+def test_codec_roundtrip_is_exact():
+    for snapshot in load_capture_snapshots():
+        if not snapshot:
+            continue
+        layout, blob = snapshot_codec.encode(snapshot)
+        decoded = snapshot_codec.decode(json.dumps(layout), blob)
+        assert decoded == snapshot
+        assert list(decoded['DeltaSol SLL [Regler]']) == list(snapshot['DeltaSol SLL [Regler]'])
+        assert len(blob) * 10 < len(json.dumps(snapshot, ensure_ascii=False).encode('utf-8'))
+
+
+def test_codec_rejects_unrepresentable_values():
+    assert snapshot_codec.encode({'dev': {'a': 'on'}}) is None
+    assert snapshot_codec.encode({'dev': {'a': '1.10 V'}}) is None
+    layout, blob = snapshot_codec.encode({'dev': {'a': '5', 'b': '-0.1 °C'}})
+    assert snapshot_codec.decode(json.dumps(layout), blob) == {'dev': {'a': '5', 'b': '-0.1 °C'}}
+
+
+def test_compact_db_reads_back_in_order(tmp_path):
+    db = DBManager(str(tmp_path / 'resol.db'), compact=True)
+    db.connect()
+    snapshots = [s for s in load_capture_snapshots() if s]
+    db.insert_snapshot('2025-01-01T00:00:02Z', snapshots[1])
+    db.insert_snapshot('2025-01-01T00:00:01Z', {'dev': {'state': 'on'}})  # falls back to JSON
+    db.insert_snapshot('2025-01-01T00:00:00Z', snapshots[0])
+
+    rows = list(db.iter_snapshots())
+    assert [ts for ts, _ in rows] == ['2025-01-01T00:00:00Z', '2025-01-01T00:00:01Z', '2025-01-01T00:00:02Z']
+    assert rows[0][1] == snapshots[0] and rows[2][1] == snapshots[1]
+    assert db.conn.execute('SELECT COUNT(*) FROM snapshot_schemas').fetchone()[0] == 1
+    db.close()
+
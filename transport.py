@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Pluggable byte-stream transports for the collector.
+
+A transport is a socket-like object (`recv`/`send` for network streams,
+`read` for serial-like streams) that delivers raw VBus bytes. Factories are
+registered by name; `open_transport()` picks one by `config.connection`:
+
+- lan:    VBus/LAN adapter (or simulator.py) with the +HELLO / PASS / DATA
+          handshake done before the object is returned
+- serial: pyserial port (`config.port`, `config.baudrate`)
+- replay: recorded .bin captures played back in a loop, optionally paced to
+          a byte rate; used for soak tests without a device
+
+Further transports register themselves with `@register('name')`.
+"""
+
+import glob
+import socket
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import config
+
+TRANSPORTS: Dict[str, Callable] = {}
+
+
+def register(name: str):
+    def decorator(factory):
+        TRANSPORTS[name] = factory
+        return factory
+    return decorator
+
+
+def parse_address(text: str) -> Tuple[str, int]:
+    """'host:port' -> (host, port)."""
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class LanTransport:
+    """A logged-in VBus/LAN connection streaming DATA.
+
+    Bytes that arrived together with the handshake replies are returned by
+    the first `recv()` calls, so no data is lost.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.pending = b''
+
+    def _reply(self) -> bytes:
+        while b'\n' not in self.pending:
+            chunk = self.sock.recv(1024)
+            if not chunk:
+                raise ConnectionError('connection closed during handshake')
+            self.pending += chunk
+        line, _, self.pending = self.pending.partition(b'\n')
+        return line
+
+    def login(self, password: str):
+        if not self._reply().startswith(b'+HELLO'):
+            raise ConnectionError('device did not send +HELLO')
+        self.sock.sendall(('PASS %s\n' % password).encode('ascii'))
+        if not self._reply().startswith(b'+OK'):
+            raise ConnectionError('password rejected')
+        self.sock.sendall(b'DATA\n')
+        if not self._reply().startswith(b'+OK'):
+            raise ConnectionError('DATA request rejected')
+
+    def recv(self, n: int) -> bytes:
+        if self.pending:
+            data, self.pending = self.pending[:n], self.pending[n:]
+            return data
+        return self.sock.recv(n)
+
+    def send(self, data: bytes):
+        self.sock.sendall(data)
+
+    def settimeout(self, timeout: Optional[float]):
+        self.sock.settimeout(timeout)
+
+    def close(self):
+        self.sock.close()
+
+
+@register('lan')
+def open_lan(address: Optional[Tuple[str, int]] = None, password: Optional[str] = None,
+             timeout: float = 5.0) -> LanTransport:
+    sock = socket.create_connection(address or config.address, timeout=timeout)
+    transport = LanTransport(sock)
+    try:
+        transport.login(config.vbus_pass if password is None else password)
+    except Exception:
+        sock.close()
+        raise
+    return transport
+
+
+@register('serial')
+def open_serial(port: Optional[str] = None, baudrate: Optional[int] = None, timeout: float = 1.0):
+    import serial
+    return serial.Serial(port or config.port, baudrate=baudrate or config.baudrate, timeout=timeout)
+
+
+class ReplayTransport:
+    """Serial-like transport replaying capture files in a loop.
+
+    `bytes_per_second` paces `read()` (VBus runs at 9600 baud, about 960
+    bytes/s); None replays as fast as the reader consumes.
+    """
+
+    def __init__(self, files: List[str], bytes_per_second: Optional[float] = None, loop: bool = True):
+        if not files:
+            raise ValueError('no capture files to replay')
+        self.files = files
+        self.bytes_per_second = bytes_per_second
+        self.loop = loop
+        self.index = 0
+        self.data = b''
+        self.pos = 0
+        self.started = time.monotonic()
+        self.sent = 0
+
+    def _next_file(self) -> bool:
+        if self.index >= len(self.files):
+            if not self.loop:
+                return False
+            self.index = 0
+        with open(self.files[self.index], 'rb') as f:
+            self.data = f.read()
+        self.index += 1
+        self.pos = 0
+        return True
+
+    def read(self, n: int) -> bytes:
+        if self.bytes_per_second:
+            allowed = int((time.monotonic() - self.started) * self.bytes_per_second) - self.sent
+            if allowed <= 0:
+                time.sleep(min(0.1, n / self.bytes_per_second))
+                return b''
+            n = min(n, allowed)
+        if self.pos >= len(self.data) and not self._next_file():
+            return b''
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += len(chunk)
+        self.sent += len(chunk)
+        return chunk
+
+    def close(self):
+        self.data = b''
+
+
+@register('replay')
+def open_replay(pattern: str = 'captures/*.bin', bytes_per_second: Optional[float] = None,
+                loop: bool = True) -> ReplayTransport:
+    return ReplayTransport(sorted(glob.glob(pattern)), bytes_per_second=bytes_per_second, loop=loop)
+
+
+def open_transport(name: Optional[str] = None, **options):
+    """Open the transport `name` (default `config.connection`) with `options`
+    (default `config.transport_options`)."""
+    name = name or config.connection
+    if name not in TRANSPORTS:
+        raise RuntimeError('unknown connection %r (available: %s)' % (name, ', '.join(sorted(TRANSPORTS))))
+    if not options:
+        options = dict(getattr(config, 'transport_options', {}).get(name, {}))
+    return TRANSPORTS[name](**options)
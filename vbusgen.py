@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Generate valid VBus PV1 frames from spec packets.
+
+Used by the conformance tests and anything else that needs realistic VBus
+traffic without a device. A PV1 message on the wire is:
+
+    0xAA, dst lo, dst hi, src lo, src hi, 0x10, cmd lo, cmd hi, frame count,
+    header checksum, then per 4 payload bytes: 4 data bytes with the top bit
+    cleared, the septet byte holding those top bits, and a frame checksum.
+
+Public API:
+- build_pv1_message(destination, source, command, payload) -> bytes
+- payload_length(packet) -> int
+- random_payload(packet, rng) -> bytes
+- load_catalogue(pattern) -> [(spec file, spec dict), ...]
+"""
+
+import glob
+import json
+import os
+import random
+from typing import Dict, List, Tuple
+
+from parser import calc_checksum
+
+SYNC = b'\xAA'
+
+
+def encode_frame(data: bytes) -> bytes:
+    """Encode 4 payload bytes into a 6-byte frame (data, septet, checksum)."""
+    septet = 0
+    out = bytearray()
+    for j, b in enumerate(data):
+        if b & 0x80:
+            septet |= 1 << j
+        out.append(b & 0x7F)
+    out.append(septet)
+    out.append(calc_checksum(out))
+    return bytes(out)
+
+
+def build_pv1_message(destination: int, source: int, command: int, payload: bytes) -> bytes:
+    """Return a complete PV1 message, starting with the sync byte.
+
+    The payload is zero-padded to a multiple of 4 bytes.
+    """
+    if len(payload) % 4:
+        payload = payload + b'\0' * (4 - len(payload) % 4)
+    frame_count = len(payload) // 4
+    if frame_count > 0x7F:
+        raise ValueError('payload too long for one PV1 message')
+    header = bytearray([
+        destination & 0xFF, destination >> 8,
+        source & 0xFF, source >> 8,
+        0x10,
+        command & 0xFF, command >> 8,
+        frame_count,
+    ])
+    header.append(calc_checksum(header))
+    frames = b''.join(encode_frame(payload[i:i + 4]) for i in range(0, len(payload), 4))
+    return SYNC + bytes(header) + frames
+
+
+def packet_address(packet: Dict) -> Tuple[int, int, int]:
+    """(destination, source, command) of a spec packet as integers."""
+    return int(packet['destination'], 16), int(packet['source'], 16), int(packet['command'], 16)
+
+
+def payload_length(packet: Dict) -> int:
+    """Smallest payload (multiple of 4) covering every field of `packet`."""
+    end = 0
+    for field in packet.get('field', []):
+        if 'offset' in field:
+            end = max(end, int(field['offset']) + max(1, (int(field['bitSize']) + 1) // 8))
+    return (end + 3) // 4 * 4
+
+
+def random_payload(packet: Dict, rng: random.Random) -> bytes:
+    """Random payload for `packet`; about a third of the fields get an extreme
+    value (0, -1, minimum or maximum) so sign handling is always exercised."""
+    payload = bytearray(rng.getrandbits(8) for _ in range(payload_length(packet)))
+    for field in packet.get('field', []):
+        if 'offset' not in field or rng.random() > 0.33:
+            continue
+        offset = int(field['offset'])
+        length = (int(field['bitSize']) + 1) // 8
+        if not length:
+            continue
+        extreme = rng.choice([0, -1, -(1 << (8 * length - 1)), (1 << (8 * length - 1)) - 1])
+        payload[offset:offset + length] = extreme.to_bytes(length, 'little', signed=True)
+    return bytes(payload)
+
+
+def load_catalogue(pattern: str = None) -> List[Tuple[str, Dict]]:
+    """Load every JSON spec matching `pattern` (default: spec/*.json next to this file)."""
+    if pattern is None:
+        pattern = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spec', '*.json')
+    catalogue = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'r', encoding='utf-8') as f:
+            catalogue.append((path, json.load(f)['vbusSpecification']))
+    return catalogue